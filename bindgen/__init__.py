@@ -1,24 +1,52 @@
+import os
+
 from functools import reduce
 from operator import add
-from re import match
+from time import perf_counter
 from sys import platform
 from typing import List
 
 import logzero
 import toml as toml
 import pandas as pd
-import pyparsing as pp
 
 from joblib import Parallel, delayed
 from path import Path
 from tqdm import tqdm
-from jinja2 import Environment, FileSystemLoader
 from toposort import toposort_flatten
 
 from .module import ModuleInfo
-from .header import parse_tu, ClassInfo, get_symbols, get_namespaces
-from .utils import current_platform, get_includes, init_clang
+from .matchers import compile_matcher, group_exclusions
+from .view import (
+    SIGNATURES,
+    ModuleView,
+    proper_new_operator,
+    proper_delete_operator,
+    references_inner,
+)
+from .shards import Shard, ShardFolder, load
+from .ir import IR, ModuleSet, summarize, toposort_summaries, write_ir
+from .symbols import SymbolTable, MappedSymbolTable, is_symbol_table
+from .cache import HeaderCache, TransformCache, load_timings, save_timings, prune
+from .header import (
+    parse_tu,
+    process_header,
+    process_headers,
+    ClassInfo,
+    get_symbols,
+    get_symbol_index,
+    get_namespaces,
+)
+from .utils import (
+    current_platform,
+    get_includes,
+    init_clang,
+    object_digest,
+    write_if_changed,
+)
 from .schemas import global_schema, module_schema
+from .type_parser import type_matcher
+from .templates import make_template_environment, precompiled_path, template_paths
 
 
 def read_settings(p):
@@ -46,11 +74,15 @@ def read_settings(p):
 
 
 def read_symbols(p):
-    """Read provided symbols file and return a dataframe
+    """Read provided symbols file and return a symbol table
 
-    This information is used later for flagging undefined symbols
+    This information is used later for flagging undefined symbols. Binary
+    symbol tables created by `bindgen symbols build` are memory-mapped.
     """
 
+    if is_symbol_table(p):
+        return MappedSymbolTable(p)
+
     if int(pd.__version__.split(".")[0]) >= 2:
         sym = pd.read_csv(
             p, header=None, names=["name"], sep="\\s+", on_bad_lines="skip"
@@ -59,24 +91,24 @@ def read_symbols(p):
         sym = pd.read_csv(
             p, header=None, names=["name"], delim_whitespace=True, error_bad_lines=False
         ).dropna()
-    return sym
+    return SymbolTable(sym.name)
 
 
 def remove_undefined_mangled(m, sym):
 
     # exclude methods
     for c in m.classes:
-        c.methods_unfiltered = c.methods
-        c.methods_byref_unfiltered = c.methods_byref
-        c.methods_return_byref_unfiltered = c.methods_return_byref
-        c.static_methods_unfiltered = c.static_methods
-        c.static_methods_byref_unfiltered = c.static_methods_byref
-        c.constructors_unfiltered = c.constructors
+        c.methods_unfiltered = tuple(c.methods)
+        c.methods_byref_unfiltered = tuple(c.methods_byref)
+        c.methods_return_byref_unfiltered = tuple(c.methods_return_byref)
+        c.static_methods_unfiltered = tuple(c.static_methods)
+        c.static_methods_byref_unfiltered = tuple(c.static_methods_byref)
+        c.constructors_unfiltered = tuple(c.constructors)
 
         c.methods = [
             el
             for el in c.methods
-            if sym.name.str.endswith(el.mangled_name).any()
+            if sym.has_suffix(el.mangled_name)
             or el.inline
             or el.pure_virtual
             or el.virtual
@@ -84,7 +116,7 @@ def remove_undefined_mangled(m, sym):
         c.methods_byref = [
             el
             for el in c.methods_byref
-            if sym.name.str.endswith(el.mangled_name).any()
+            if sym.has_suffix(el.mangled_name)
             or el.inline
             or el.pure_virtual
             or el.virtual
@@ -92,7 +124,7 @@ def remove_undefined_mangled(m, sym):
         c.methods_return_byref = [
             el
             for el in c.methods_return_byref
-            if sym.name.str.endswith(el.mangled_name).any()
+            if sym.has_suffix(el.mangled_name)
             or el.inline
             or el.pure_virtual
             or el.virtual
@@ -100,17 +132,17 @@ def remove_undefined_mangled(m, sym):
         c.static_methods = [
             el
             for el in c.static_methods
-            if sym.name.str.endswith(el.mangled_name).any() or el.inline
+            if sym.has_suffix(el.mangled_name) or el.inline
         ]
         c.static_methods_byref = [
             el
             for el in c.static_methods_byref
-            if sym.name.str.endswith(el.mangled_name).any() or el.inline
+            if sym.has_suffix(el.mangled_name) or el.inline
         ]
         c.constructors = [
             el
             for el in c.constructors
-            if sym.name.str.endswith(el.mangled_name).any()
+            if sym.has_suffix(el.mangled_name)
             or el.inline
             or el.pure_virtual
             or el.virtual
@@ -120,7 +152,7 @@ def remove_undefined_mangled(m, sym):
     m.functions = [
         f
         for f in m.functions
-        if sym.name.str.startswith(f.mangled_name).any() or f.inline
+        if sym.has_prefix(f.mangled_name) or f.inline
     ]
 
     # exclude functions per header
@@ -129,18 +161,13 @@ def remove_undefined_mangled(m, sym):
         h.functions = [
             f
             for f in h.functions
-            if sym.name.str.startswith(f.mangled_name).any() or f.inline
+            if sym.has_prefix(f.mangled_name) or f.inline
         ]
 
 
 def is_byref_arg(arg, byref_types):
 
-    rv = False
-
-    if any(arg.startswith(byref_t) and arg.endswith("&") for byref_t in byref_types):
-        rv = True
-
-    return rv
+    return type_matcher(byref_types).matches(arg)
 
 
 def is_byref_return(met):
@@ -156,69 +183,61 @@ def is_byref_return(met):
 
 def is_byref(met, byref_types):
 
-    rv = False
+    matches = type_matcher(byref_types).matches
 
-    if met.return_type == "void":
-        for _, arg, _ in met.args:
-            if any(
-                arg.startswith(byref_t) and arg.endswith("&") for byref_t in byref_types
-            ):
-                rv = True
-                break
-
-    return rv
+    return met.return_type == "void" and any(matches(arg) for _, arg, _ in met.args)
 
 
 def type_form_byref_smart_ptr(t: str, ptr_types: List[str]) -> str:
 
-    expr = (pp.Suppress(pp.Or(map(pp.Literal, ptr_types)) + pp.Literal('<'))
-            + pp.Word(pp.alphanums+'_') + pp.Suppress(pp.Literal('>') + pp.Literal('&')))
-
-    return expr.parse_string(t)[0]
+    return type_matcher(ptr_types).pointee(t)
 
 
 def _exclude_methods(classes, exclusions):
 
-    for pat in exclusions:
-        cls_pat, m_pat = pat.split("::")
-        for c in (c for c in classes if match(cls_pat, c.name)):
-            c.methods = [m for m in c.methods if not match(m_pat, m.name)]
-            c.static_methods = [
-                m for m in c.static_methods if not match(m_pat, m.name)]
-            c.operators = [m for m in c.operators if not match(m_pat, m.name)]
+    for c, pats in group_exclusions(classes, exclusions).values():
+        excluded = compile_matcher(tuple(pats))
+
+        c.methods = [m for m in c.methods if not excluded(m.name)]
+        c.static_methods = [m for m in c.static_methods if not excluded(m.name)]
+        c.operators = [m for m in c.operators if not excluded(m.name)]
 
 
 def transform_module(m, sym, settings, settings_per_module, platform=None):
 
     s = settings_per_module.get(m.name, None)
-    global_excludes = settings[platform if platform else current_platform()]["exclude_classes"]
+    global_excludes = compile_matcher(
+        tuple(settings[platform if platform else current_platform()]["exclude_classes"])
+    )
 
     # handle global excludes
-    m.classes = [
-        c for c in m.classes if not any(match(pat, c.name) for pat in global_excludes)
-    ]
+    m.classes = [c for c in m.classes if not global_excludes(c.name)]
     m.class_dict = {
-        k: v
-        for k, v, in m.class_dict.items()
-        if not any(match(pat, k) for pat in global_excludes)
+        k: v for k, v, in m.class_dict.items() if not global_excludes(k)
     }
 
     if s:
         # exclude classes
-        m.classes = [
-            c for c in m.classes if c.name not in s["exclude_classes"]]
+        exclude_classes = set(s["exclude_classes"])
+
+        m.classes = [c for c in m.classes if c.name not in exclude_classes]
         m.class_dict = {
-            k: v for k, v, in m.class_dict.items() if k not in s["exclude_classes"]
+            k: v for k, v, in m.class_dict.items() if k not in exclude_classes
         }
 
         # exclude class templates
+        exclude_templates = set(s["exclude_class_templates"])
+        excluded_instances = compile_matcher(
+            tuple(s["exclude_class_templates"]), template=True
+        )
+
         m.class_templates = [
-            c for c in m.class_templates if c.name not in s["exclude_class_templates"]
+            c for c in m.class_templates if c.name not in exclude_templates
         ]
         m.class_template_dict = {
             k: v
             for k, v, in m.class_template_dict.items()
-            if not any(match(f"^{pat}<.*>", k) for pat in s["exclude_class_templates"])
+            if not excluded_instances(k)
         }
 
         # exclude methods (including static methods)
@@ -227,19 +246,18 @@ def transform_module(m, sym, settings, settings_per_module, platform=None):
                          s["exclude_class_template_methods"])
 
         # exclude functions
-        m.functions = [
-            f for f in m.functions if f.name not in s["exclude_functions"]]
+        exclude_functions = set(s["exclude_functions"])
+
+        m.functions = [f for f in m.functions if f.name not in exclude_functions]
         for h in m.headers:
-            h.functions = [
-                f for f in h.functions if f.name not in s["exclude_functions"]
-            ]
+            h.functions = [f for f in h.functions if f.name not in exclude_functions]
 
         # exclude typedefs
-        m.typedefs = [
-            t for t in m.typedefs if t.name not in s["exclude_typedefs"]]
+        exclude_typedefs = set(s["exclude_typedefs"])
+
+        m.typedefs = [t for t in m.typedefs if t.name not in exclude_typedefs]
         for h in m.headers:
-            h.typedefs = [
-                t for t in h.typedefs if t.name not in s["exclude_typedefs"]]
+            h.typedefs = [t for t in h.typedefs if t.name not in exclude_typedefs]
 
     # collect methods and static methods using byref i.s.o. return
     byref_types = settings["byref_types"] + settings["byref_types_smart_ptr"]
@@ -268,12 +286,14 @@ def transform_module(m, sym, settings, settings_per_module, platform=None):
                 c.static_methods.remove(met)
 
     # collect exceptions
+    is_exception = compile_matcher(tuple(settings["exceptions"]))
+
     for c in m.classes:
-        if any([match(pat, c.name) for pat in settings["exceptions"]]):
+        if is_exception(c.name):
             m.exceptions.append(c)
         elif c.superclasses:
             for s in (s for s in c.superclasses if s):  # remove None etc
-                if any([match(pat, s) for pat in settings["exceptions"]]):
+                if is_exception(s):
                     m.exceptions.append(c)
                     break
 
@@ -301,8 +321,29 @@ def split_into_modules(names, files):
     return rv
 
 
+def find_module_files(path, module_names, pats, exclude):
+    """Headers of every module matching the file patterns
+    """
+
+    file_pats = [p.format(m) for m in module_names for p in pats]
+
+    all_files = reduce(add, (path.files(pat) for pat in file_pats))
+    all_files = set(f for f in all_files if f.name not in exclude)
+
+    return split_into_modules(module_names, all_files)
+
+
 def parse_modules(
-    verbose, n_jobs, settings, module_mapping, settings_per_module, target_platform
+    verbose,
+    n_jobs,
+    settings,
+    module_mapping,
+    settings_per_module,
+    target_platform,
+    cache=None,
+    umbrella=False,
+    ast_size=0,
+    lazy=False,
 ):
 
     settings["Modules"] = settings_per_module
@@ -318,18 +359,14 @@ def parse_modules(
     else:
         module_names += settings[target_platform]["modules"]
 
-    file_pats = [p.format(m) for m in module_names for p in settings["pats"]]
-
-    all_files = reduce(add, (path.files(pat) for pat in file_pats))
-    all_files = set(f for f in all_files if f.name not in file_exc)
-
-    module_dict = split_into_modules(module_names, all_files)
+    module_dict = find_module_files(path, module_names, file_pats, file_exc)
 
-    modules = []
+    header_cache = HeaderCache(cache, ast_size > 0) if cache else None
+    timings = load_timings(cache) if cache else {}
 
-    # parse modules using libclang
+    # parse headers using libclang
 
-    def _process_module(name, files, module_names, includes, clang_location):
+    def _process_headers(name, files, umbrella, includes, clang_location, shards):
 
         # loky based workaround
         get_includes.__defaults__ = includes
@@ -340,174 +377,281 @@ def parse_modules(
             :-1] + (exclude_ns,)
         get_namespaces.__defaults__ = get_namespaces.__defaults__[
             :-1] + (exclude_ns,)
+        get_symbol_index.__defaults__ = get_symbol_index.__defaults__[
+            :-1] + (exclude_ns,)
 
         if not verbose:
             logzero.logger.setLevel(logzero.logging.INFO)
-        return ModuleInfo(name, path, files, module_names, settings)
 
-    modules = Parallel(prefer="processes", n_jobs=n_jobs)(
-        delayed(_process_module)(
+        hits = header_cache.hits if header_cache else 0
+        t0 = perf_counter()
+
+        if umbrella:
+            his = process_headers(files, path, settings, name, header_cache)
+        else:
+            his = [process_header(files[0], path, settings, name, header_cache)]
+
+        parsed = not header_cache or header_cache.hits == hits
+
+        return Shard.dump(his, shards), perf_counter() - t0 if parsed else None
+
+    # one task per header or per umbrella TU (keyed by the module name);
+    # headers with their own parsing headers are always parsed separately
+    tasks = []
+    for name, files in module_dict.items():
+        if umbrella:
+            special = settings_per_module.get(name, {}).get("parsing_headers", {})
+            files = sorted(files)
+            regular = [p for p in files if p.name not in special]
+
+            if regular:
+                tasks.append((name, name, regular, True))
+            files = [p for p in files if p.name in special]
+
+        tasks.extend((name, p.name, [p], False) for p in files)
+
+    # schedule the slowest tasks first, unknown ones by size
+    tasks.sort(
+        key=lambda x: (
+            timings.get(x[1], float("inf")),
+            sum(p.getsize() for p in x[2]),
+        ),
+        reverse=True,
+    )
+
+    shards = ShardFolder()
+    results = Parallel(prefer="processes", n_jobs=n_jobs, batch_size=1)(
+        delayed(_process_headers)(
             name,
             files,
-            module_names,
+            umbrella,
             get_includes.__defaults__,
             init_clang.__defaults__,
+            shards.path,
         )
-        for name, files in tqdm(module_dict.items())
+        for name, _, files, umbrella in tqdm(tasks)
     )
 
-    return modules
+    module_shards = {}
+    for (name, key, files, _), (shard, t) in zip(tasks, results):
+        module_shards.setdefault(name, []).append((files, shard))
+        if t is not None:
+            timings[key] = t
+
+    if cache:
+        save_timings(cache, timings)
+
+    if header_cache and header_cache.ast:
+        prune(header_cache.ast, ast_size * 2 ** 20)
+
+    # assemble modules loading only the shards of the current one
+    def _assemble():
+
+        try:
+            for name, files in module_dict.items():
+                headers = {}
+                for task_files, shard in module_shards.get(name, []):
+                    headers.update(zip(task_files, shard.load()))
+
+                yield ModuleInfo(
+                    name,
+                    path,
+                    files,
+                    module_names,
+                    settings,
+                    headers=[headers[p] for p in files],
+                )
+        finally:
+            shards.cleanup()
+
+    return _assemble() if lazy else list(_assemble())
 
 
 def transform_modules(
-    verbose, n_jobs, settings, module_mapping, settings_per_module, modules, platform=None
+    verbose,
+    n_jobs,
+    settings,
+    module_mapping,
+    settings_per_module,
+    modules,
+    platform=None,
+    lazy=False,
+    cache=None,
 ):
 
     sym = read_symbols(settings[platform if platform else current_platform()]["symbols"])
 
     # ignore functions and classes based on settings and update the global class_dict
-    def _filter_module(m):
+    def _filter_module(m, sym, shards, key):
         if not verbose:
             logzero.logger.setLevel(logzero.logging.INFO)
+
+        m = load(m)
         logzero.logger.debug(m.name)
         transform_module(m, sym, settings, settings_per_module)
 
-        return m
-
-    modules = Parallel(prefer="processes", n_jobs=n_jobs)(
-        delayed(_filter_module)(m) for m in tqdm(modules)
-    )
-
-    # construct global class dictionary
-    class_dict = {}
-    for m in modules:
-        class_dict.update(m.class_dict)
-
-    # sort modules
-    logzero.logger.info("sorting")
-
-    cls_dict = {c.name: m.name for m in modules for c in m.classes}
-    enum_dict = {e.name: m.name for m in modules for e in m.enums}
-    # Update dependencies based on superclasses and default argument types
-
-    for m in modules:
-        m.dependencies.update(
-            [
-                cls_dict[s]
-                for c in m.classes
-                for s in c.superclass
-                if s in cls_dict and cls_dict[s] != m.name
-            ]
+        summary = (
+            m.name,
+            m.class_dict,
+            [c.name for c in m.classes],
+            [e.name for e in m.enums],
         )
-        # Consts should be removed before
-        for t in (
-            t
-            for c in m.classes
-            for method in c.methods + c.constructors + c.destructors
-            for t in method.default_value_types
-        ):
-            if t.startswith("const "):
-                t = t.split("const ")[1]
-            if t in cls_dict and cls_dict[t] != m.name:
-                m.dependencies.add(cls_dict[t])
-            # elif t in enum_dict and enum_dict[t] != m.name:
-            #    m.dependencies.add(enum_dict[t])
-
-    # remove duplicate typedefs
-    logzero.logger.info("removing duplicate typedefs")
-
-    typedefs_dict = {}
-    for m in modules:
-        for h in m.headers:
-            to_remove = []
-            for t in h.typedefs:
-                if t.type in typedefs_dict:
-                    typedefs_dict[t.type].append(t)
-                    to_remove.append(t)
-                else:
-                    typedefs_dict[t.type] = [t]
-
-            for t in to_remove:
-                h.typedefs.remove(t)
 
-    return modules, class_dict, enum_dict
-
-
-def toposort_modules(modules):
+        if key:
+            return transform_cache.store(key, m, *summary)
 
-    deps = {}
+        return (Shard.dump(m, shards), *summary)
 
-    cls_dict = {c.name: m.name for m in modules for c in m.classes}
-    tmpl_dict = {t.name: t for m in modules for t in m.class_templates}
+    shards = ShardFolder()
 
-    for m in modules:
+    # workers map the symbol table instead of receiving a copy per module
+    if not isinstance(sym, MappedSymbolTable):
+        sym.save(shards.path / "symbols.bin")
+        sym = MappedSymbolTable(shards.path / "symbols.bin")
 
-        typedefs = []
-        for t in m.typedefs:
-            if not t.pod:
-                if t.template_base:
-                    if t.template_base[0] in tmpl_dict:
-                        typedefs.append(tmpl_dict[t.template_base[0]])
-
-        deps[m.name] = set(
-            cls_dict[s]
-            for c in m.classes + m.class_templates + typedefs
-            for s in c.superclass
-            if s in cls_dict
-        ) - {m.name}
+    # digests of the parsed modules (IR folders store them in their index)
+    if isinstance(modules, IR):
+        names = modules.names
+        digests = [modules.summaries[n].get("digest") for n in names]
+        modules = modules.shards()
+    else:
+        modules = list(modules)
+        names = [m.name for m in modules]
+        digests = [getattr(m, "digest", None) for m in modules]
+
+    # reuse modules transformed with identical inputs in previous runs
+    transform_cache = TransformCache(cache) if cache else None
+    keys = [None] * len(modules)
+    results = [None] * len(modules)
+
+    if transform_cache:
+        global_settings = (
+            settings[current_platform()]["exclude_classes"],
+            settings["exceptions"],
+            settings["byref_types"],
+            settings["byref_types_smart_ptr"],
+        )
 
-    return toposort_flatten(deps)
+        for i, name in enumerate(names):
+            keys[i] = transform_cache.key(
+                digests[i] or object_digest(load(modules[i])),
+                settings_per_module.get(name),
+                global_settings,
+                sym,
+            )
+            results[i] = transform_cache.load(keys[i])
 
+        logzero.logger.info(
+            f"{transform_cache.hits} of {len(modules)} modules loaded from the cache"
+        )
 
-def render(settings, module_settings, modules, class_dict, prefix=Path(""), platform=None):
+    todo = [i for i, rv in enumerate(results) if rv is None]
 
-    name = settings["name"]
-    module_names = [m.name for m in modules]
-    output_path = Path(settings["output_folder"])
-    operator_dict = settings["Operators"]
+    # workers load in-memory modules from shards too, instead of receiving
+    # them pickled with their task
+    if n_jobs != 1:
+        for i in todo:
+            if not isinstance(modules[i], Shard):
+                modules[i] = Shard.dump(modules[i], shards.path)
 
-    pre = settings["Extras"]["include_pre"]
-    post = settings["Extras"]["include_post"]
+    for i, rv in zip(
+        todo,
+        Parallel(prefer="processes", n_jobs=n_jobs)(
+            delayed(_filter_module)(modules[i], sym, shards.path, keys[i])
+            for i in tqdm(todo)
+        ),
+    ):
+        results[i] = rv
 
-    def proper_new_operator(cls):
+    sym.close()
 
-        new_ops = [op for op in cls.static_operators if op.name == "operator new"]
+    # construct global class dictionary
+    class_dict = {}
+    for _, _, module_class_dict, _, _ in results:
+        class_dict.update(module_class_dict)
+
+    cls_dict = {c: name for _, name, _, classes, _ in results for c in classes}
+    enum_dict = {e: name for _, name, _, _, enums in results for e in enums}
+
+    # finish the modules one by one
+    def _finalize():
+
+        logzero.logger.info("sorting and removing duplicate typedefs")
+        typedefs = set()
+
+        try:
+            for shard, *_ in results:
+                m = shard.load()
+
+                # Update dependencies based on superclasses and default argument types
+                m.dependencies.update(
+                    [
+                        cls_dict[s]
+                        for c in m.classes
+                        for s in c.superclass
+                        if s in cls_dict and cls_dict[s] != m.name
+                    ]
+                )
+                # Consts should be removed before
+                for t in (
+                    t
+                    for c in m.classes
+                    for method in c.methods + c.constructors + c.destructors
+                    for t in method.default_value_types
+                ):
+                    if t.startswith("const "):
+                        t = t.split("const ")[1]
+                    if t in cls_dict and cls_dict[t] != m.name:
+                        m.dependencies.add(cls_dict[t])
+                    # elif t in enum_dict and enum_dict[t] != m.name:
+                    #    m.dependencies.add(enum_dict[t])
+
+                # remove duplicate typedefs
+                for h in m.headers:
+                    to_remove = []
+                    for t in h.typedefs:
+                        if t.type in typedefs:
+                            to_remove.append(t)
+                        else:
+                            typedefs.add(t.type)
+
+                    for t in to_remove:
+                        h.typedefs.remove(t)
+
+                yield m
+        finally:
+            shards.cleanup()
+
+    modules = _finalize() if lazy else list(_finalize())
 
-        if not new_ops:
-            return True
+    return modules, class_dict, enum_dict
 
-        new_ops = [op for op in new_ops if len(op.args) == 1]
 
-        return new_ops
+def toposort_modules(modules):
 
-    def proper_delete_operator(cls):
+    return toposort_summaries({m.name: summarize(m) for m in modules})
 
-        del_ops = [op for op in cls.static_operators if op.name ==
-                   "operator delete"]
 
-        if not del_ops:
-            return True
+def make_environment(settings, modules, class_dict, platform=None, cache=None):
+    """Jinja environment with the globals shared by all modules
+    """
 
-        del_ops = [op for op in del_ops if len(op.args) == 1]
+    name = settings["name"]
+    operator_dict = settings["Operators"]
 
-        return del_ops
+    pre = settings["Extras"]["include_pre"]
+    post = settings["Extras"]["include_post"]
 
-    default_path = [Path(__file__).dirname()]
-    additional_path = (
-        [Path(settings["template_path"]),] if settings["template_path"] else []
+    jinja_env = make_template_environment(
+        template_paths(settings), cache, precompiled_path(settings)
     )
-    template_paths = additional_path + default_path
 
-    jinja_env = Environment(
-        loader=FileSystemLoader(template_paths),
-        trim_blocks=True,
-        lstrip_blocks=True,
-        extensions=["jinja2.ext.do"],
-    )
+    all_classes = modules.classes
+    all_enums = modules.enums
+    all_typedefs = modules.typedefs
 
-    all_classes = {c.name: c for m in modules for c in m.classes}
-    all_enums = {e.name: e for m in modules for e in m.enums}
-    all_typedefs = {t.name: t for m in modules for t in m.typedefs}
+    byref = type_matcher(settings["byref_types"])
+    byref_smart_ptr = type_matcher(settings["byref_types_smart_ptr"])
 
     jinja_env.globals.update(
         {
@@ -516,14 +660,10 @@ def render(settings, module_settings, modules, class_dict, prefix=Path(""), plat
                 for p in c.superclasses
                 if p in all_classes
             ),
-            "is_byref": lambda t: is_byref_arg(t, settings["byref_types"]),
-            "is_byref_smart_ptr": lambda t: is_byref_arg(
-                t, settings["byref_types_smart_ptr"]
-            ),
-            "type_from_byref_smart_ptr": lambda t: type_form_byref_smart_ptr(t, settings["byref_types_smart_ptr"]),
-            "args_byref": lambda f: [
-                arg for arg, t, _ in f.args if is_byref_arg(t, settings["byref_types"])
-            ],
+            "is_byref": byref.matches,
+            "is_byref_smart_ptr": byref_smart_ptr.matches,
+            "type_from_byref_smart_ptr": byref_smart_ptr.pointee,
+            "args_byref": lambda f: [arg for arg, t, _ in f.args if byref.matches(t)],
             "enumerate": enumerate,
             "platform": platform if platform else current_platform(),
             "class_dict": class_dict,
@@ -534,105 +674,225 @@ def render(settings, module_settings, modules, class_dict, prefix=Path(""), plat
             "operator_dict": operator_dict,
             "include_pre": pre,
             "include_post": post,
-            "references_inner": lambda name, method: name + "::" in method.return_type
-            or any([name + "::" in a for _, a, _ in method.args]),
+            "references_inner": references_inner,
             "proper_new_operator": proper_new_operator,
             "proper_delete_operator": proper_delete_operator,
-            "module_names": module_names,
-            "sorted_modules": toposort_modules(modules),
+            "module_names": modules.names,
+            "sorted_modules": toposort_summaries(modules.summaries),
             "settings": settings,
         }
     )
 
+    jinja_env.globals.update({f.__name__: f for f in SIGNATURES})
     jinja_env.filters["get"] = lambda x, n: x[n]
 
+    return jinja_env
+
+
+def render_module(jinja_env, m, module_settings, output_path):
+    """Render the files of a single module and return how many of them changed
+
+    Module specific settings are passed in the render context, so modules
+    can be rendered concurrently with the same environment.
+    """
+
     template_sub = jinja_env.get_template("template_sub.j2")
     template_sub_pre = jinja_env.get_template("template_sub_pre.j2")
     template_tmpl = jinja_env.get_template("template_templates.j2")
-    template_main = jinja_env.get_template("template_main.j2")
-    template_cmake = jinja_env.get_template("CMakeLists.j2")
 
-    output_path.mkdir_p()
-    with output_path:
-        for m in tqdm(modules):
-            tqdm.write(f"Processing module {m.name}")
+    view = ModuleView(
+        m,
+        jinja_env.globals["all_classes"],
+        jinja_env.globals["is_byref"],
+        jinja_env.globals["is_byref_smart_ptr"],
+        jinja_env.globals["type_from_byref_smart_ptr"],
+    )
 
-            jinja_env.globals.update(
-                {
-                    "module_settings": module_settings.get(
-                        m.name, module_schema.validate({})
-                    )
-                }
-            )
+    context = {
+        "module": m,
+        "module_settings": module_settings.get(m.name, module_schema.validate({})),
+        "view": view,
+    }
 
-            class_templates = {el.name: el for el in m.class_templates}
+    class_templates = {el.name: el for el in m.class_templates}
 
-            typedefs = (
-                t
-                for h in m.headers
-                for t in h.typedefs
-                if not t.pod
-                and not "_H" in t.name
-                and len(t.template_base) > 0
-                and not t.type.startswith("opencascade::handle")
-            )
-            typedefs = filter(
-                lambda t: not t.type.split(t.template_base[0])[-1].endswith(
-                    "::Iterator"
-                ),
-                typedefs,
+    typedefs = (
+        t
+        for h in m.headers
+        for t in h.typedefs
+        if not t.pod
+        and not "_H" in t.name
+        and len(t.template_base) > 0
+        and not t.type.startswith("opencascade::handle")
+    )
+    typedefs = filter(
+        lambda t: not t.type.split(t.template_base[0])[-1].endswith(
+            "::Iterator"
+        ),
+        typedefs,
+    )
+
+    classes_typedefs = {el.name: el for el in (
+        m.classes + list(typedefs))}
+
+    dag = {}
+    for el in classes_typedefs.values():
+        if isinstance(el, ClassInfo):
+            deps = set(el.superclass)
+        else:
+            base = el.template_base[0]
+            deps = set(el.template_args)
+            deps |= (
+                set(class_templates[base].superclass)
+                if base in class_templates
+                else set()
             )
 
-            classes_typedefs = {el.name: el for el in (
-                m.classes + list(typedefs))}
-
-            dag = {}
-            for el in classes_typedefs.values():
-                if isinstance(el, ClassInfo):
-                    deps = set(el.superclass)
-                else:
-                    base = el.template_base[0]
-                    deps = set(el.template_args)
-                    deps |= (
-                        set(class_templates[base].superclass)
-                        if base in class_templates
-                        else set()
-                    )
-
-                dag[el.name] = deps
-
-            sorted_classes_typedefs = [
-                classes_typedefs[k]
-                for k in toposort_flatten(dag)
-                if k in classes_typedefs
-            ]
+        dag[el.name] = deps
 
-            with open(f"{m.name}_pre.cpp", "w") as f:
-                f.write(
-                    template_sub_pre.render(
-                        {
-                            "module": m,
-                            "classes_typedefs": sorted_classes_typedefs,
-                            "str": str,
-                            "type": type,
-                        }
-                    )
-                )
+    sorted_classes_typedefs = [
+        classes_typedefs[k]
+        for k in toposort_flatten(dag)
+        if k in classes_typedefs
+    ]
 
-            with open(f"{m.name}.cpp", "w") as f:
-                f.write(template_sub.render({"module": m}))
+    pre = template_sub_pre.generate(
+        {
+            **context,
+            "classes_typedefs": sorted_classes_typedefs,
+            "str": str,
+            "type": type,
+        }
+    )
+
+    # the output is streamed to the files instead of being rendered to strings
+    return sum(
+        (
+            write_if_changed(output_path / f"{m.name}_pre.cpp", pre),
+            write_if_changed(
+                output_path / f"{m.name}.cpp", template_sub.generate(context)
+            ),
+            write_if_changed(
+                output_path / f"{m.name}_tmpl.hxx", template_tmpl.generate(context)
+            ),
+        )
+    )
 
-            with open(f"{m.name}_tmpl.hxx", "w") as f:
-                f.write(template_tmpl.render({"module": m}))
 
-        with open(f"{name}.cpp", "w") as f:
-            f.write(template_main.render({"name": name}))
+def _plain(obj):
+    """Settings with the dict subclasses of toml (not picklable) replaced by dicts
+    """
 
-        with open("CMakeLists.txt", "w") as f:
-            f.write(template_cmake.render({"name": name}))
+    if isinstance(obj, dict):
+        return {k: _plain(v) for k, v in obj.items()}
+    elif isinstance(obj, list):
+        return [_plain(v) for v in obj]
+
+    return obj
+
+
+# environments prepared by render workers, reused for all their modules
+_environments = {}
+
+
+def _render_worker(token, ir_path, args, name, output_path):
+
+    if token not in _environments:
+        _environments.clear()
+
+        settings, module_settings, class_dict, platform, cache = args.load()
+        modules = IR(ir_path, stage="transformed")
+
+        _environments[token] = (
+            make_environment(settings, modules, class_dict, platform, cache),
+            modules,
+            module_settings,
+        )
+
+    jinja_env, modules, module_settings = _environments[token]
+
+    tqdm.write(f"Processing module {name}")
+
+    return render_module(jinja_env, modules.module(name), module_settings, output_path)
+
+
+def render(
+    settings,
+    module_settings,
+    modules,
+    class_dict,
+    prefix=Path(""),
+    platform=None,
+    only=None,
+    n_jobs=1,
+    cache=None,
+):
+
+    # in-memory list of modules or a sharded IR folder loaded on demand
+    if not isinstance(modules, IR):
+        modules = ModuleSet(modules)
+
+    name = settings["name"]
+    output_path = Path(os.path.abspath(settings["output_folder"]))
+    output_path.mkdir_p()
+
+    names = [n for n in modules.names if only is None or n in only]
+    jinja_env = make_environment(settings, modules, class_dict, platform, cache)
+
+    if n_jobs == 1:
+        changed = 0
+        for m in tqdm(modules.select(only), total=len(names)):
+            tqdm.write(f"Processing module {m.name}")
+            changed += render_module(jinja_env, m, module_settings, output_path)
+    else:
+        shards = ShardFolder()
+
+        try:
+            # workers load the modules they render from an IR folder
+            if isinstance(modules, IR):
+                ir_path = modules.path
+            else:
+                ir_path = shards.path / "ir"
+                write_ir(ir_path, "transformed", modules)
+
+            args = Shard.dump(
+                (
+                    _plain(settings),
+                    _plain(module_settings),
+                    class_dict,
+                    platform,
+                    cache,
+                ),
+                shards.path,
+                temporary=False,
+            )
+
+            changed = sum(
+                Parallel(prefer="processes", n_jobs=n_jobs)(
+                    delayed(_render_worker)(shards.path, ir_path, args, n, output_path)
+                    for n in tqdm(names)
+                )
+            )
+        finally:
+            shards.cleanup()
+
+    changed += write_if_changed(
+        output_path / f"{name}.cpp",
+        jinja_env.get_template("template_main.j2").generate({"name": name}),
+    )
+    changed += write_if_changed(
+        output_path / "CMakeLists.txt",
+        jinja_env.get_template("CMakeLists.j2").generate({"name": name}),
+    )
 
     for p in settings["additional_files"]:
-        (prefix / Path(p)).copy(output_path)
+        p = prefix / Path(p)
+        changed += write_if_changed(output_path / p.name, p.bytes(), p.stat().st_mode)
+
+    total = 3 * len(names) + 2 + len(settings["additional_files"])
+    logzero.logger.info(f"{changed} of {total} files written to {output_path}")
+
+    return changed
 
 
 def validate_result(verbose, n_jobs, folder):
@@ -1,12 +1,46 @@
+import os
 import click
 import logzero
 import pickle
 
+from time import perf_counter
 from types import SimpleNamespace
 from path import Path
 
-from . import read_settings, parse_modules, transform_modules, render, validate_result
-from .utils import get_includes, init_clang
+from . import (
+    read_settings,
+    read_symbols,
+    parse_modules,
+    transform_modules,
+    find_module_files,
+    render,
+    validate_result,
+)
+from .utils import get_includes, init_clang, write_if_changed
+from .symbols import SymbolTable
+from .ir import IR, ModuleSet, is_ir, write_ir, benchmark
+from .cache import load_timings
+from .templates import precompiled_path, template_paths
+from .templates import precompile as precompile_templates
+from .plan import snapshot, load_state, save_state, make_plan, estimate, describe
+from .exports import read_library_exports, find_libraries, is_library
+
+
+def open_ir(input, stage):
+    """Open an IR folder holding the modules of the given stage
+    """
+
+    try:
+        return IR(input, stage=stage)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+
+
+def is_sharded(output):
+    """Outputs other than .pkl files are written as sharded IR folders
+    """
+
+    return not output.endswith(".pkl")
 
 
 @click.group()
@@ -35,8 +69,29 @@ from .utils import get_includes, init_clang
     default=None,
     help="libclang location",
 )
+@click.option(
+    "-C",
+    "--cache",
+    type=click.Path(False, True, True),
+    default=None,
+    help="cache location",
+)
+@click.option(
+    "-a",
+    "--ast-size",
+    type=int,
+    default=0,
+    help="also cache libclang ASTs using at most this many MB",
+)
+@click.option(
+    "-F",
+    "--ir-format",
+    type=click.Choice(("pickle", "columnar")),
+    default="pickle",
+    help="format of the module files in IR folders",
+)
 @click.pass_context
-def main(ctx, clean, verbose, njobs, include, prefix, libclang):
+def main(ctx, clean, verbose, njobs, include, prefix, libclang, cache, ast_size, ir_format):
 
     if not verbose:
         logzero.logger.setLevel(logzero.logging.INFO)
@@ -48,7 +103,13 @@ def main(ctx, clean, verbose, njobs, include, prefix, libclang):
         init_clang.__defaults__ = (libclang,)
 
     ctx.obj = SimpleNamespace(
-        verbose=verbose, njobs=njobs, clean=clean, prefix=Path(prefix)
+        verbose=verbose,
+        njobs=njobs,
+        clean=clean,
+        prefix=Path(prefix),
+        cache=Path(os.path.abspath(cache)) if cache else None,
+        ast_size=ast_size,
+        ir_format=ir_format,
     )
 
 
@@ -61,18 +122,42 @@ def main(ctx, clean, verbose, njobs, include, prefix, libclang):
     required=False,
     type=click.Choice(("Linux", "Windows", "OSX", "FreeBSD")),
 )
+@click.option(
+    "-u",
+    "--umbrella",
+    is_flag=True,
+    help="Parse all headers of a module in a single translation unit",
+)
 @click.pass_obj
-def parse(obj, configuration, output, platform=None):
+def parse(obj, configuration, output, platform=None, umbrella=False):
+    """Parse the headers and store the modules in OUTPUT (a .pkl file or an IR
+    folder)"""
 
     settings, module_mapping, module_settings = read_settings(configuration)
+    output = os.path.abspath(output)
+    sharded = is_sharded(output)
 
     with obj.prefix:
         result = parse_modules(
-            obj.verbose, obj.njobs, settings, module_mapping, module_settings, platform
+            obj.verbose,
+            obj.njobs,
+            settings,
+            module_mapping,
+            module_settings,
+            platform,
+            cache=obj.cache,
+            umbrella=umbrella,
+            ast_size=obj.ast_size,
+            lazy=sharded,
         )
 
-    with open(output, "wb") as f:
-        pickle.dump(result, f)
+        # the IR folder is written while the modules are assembled
+        if sharded:
+            write_ir(output, "parsed", result, obj.ir_format)
+
+    if not sharded:
+        with open(output, "wb") as f:
+            pickle.dump(result, f)
 
 
 @main.command()
@@ -87,17 +172,42 @@ def parse(obj, configuration, output, platform=None):
 @click.argument("output")
 @click.pass_obj
 def transform(obj, configuration, platform, input, output):
+    """Filter the parsed modules in INPUT and store them in OUTPUT (.pkl files or
+    IR folders)"""
 
-    with open(input, "rb") as f:
-        modules = pickle.load(f)
+    if is_ir(input):
+        modules = open_ir(input, "parsed")
+    else:
+        with open(input, "rb") as f:
+            modules = pickle.load(f)
+
+    sharded = is_sharded(output)
 
     settings, module_mapping, module_settings = read_settings(configuration)
     modules, class_dict, enum_dict = transform_modules(
-        obj.verbose, obj.njobs, settings, module_mapping, module_settings, modules, platform=platform
+        obj.verbose,
+        obj.njobs,
+        settings,
+        module_mapping,
+        module_settings,
+        modules,
+        platform=platform,
+        lazy=sharded,
+        cache=obj.cache,
     )
 
-    with open(output, "wb") as f:
-        pickle.dump((modules, class_dict, enum_dict), f)
+    if sharded:
+        write_ir(
+            output,
+            "transformed",
+            modules,
+            obj.ir_format,
+            class_dict=class_dict,
+            enum_dict=enum_dict,
+        )
+    else:
+        with open(output, "wb") as f:
+            pickle.dump((modules, class_dict, enum_dict), f)
 
 
 @main.command()
@@ -109,8 +219,15 @@ def transform(obj, configuration, platform, input, output):
     type=click.Choice(("Linux", "Windows", "OSX", "FreeBSD")),
 )
 @click.argument("input")
+@click.option(
+    "-m",
+    "--module",
+    multiple=True,
+    help="Render only this module (can be repeated)",
+)
 @click.pass_obj
-def generate(obj, configuration, platform, input):
+def generate(obj, configuration, platform, input, module):
+    """Render the transformed modules in INPUT (a .pkl file or an IR folder)"""
 
     settings, module_mapping, module_settings = read_settings(configuration)
     out = Path(settings["output_folder"])
@@ -118,18 +235,32 @@ def generate(obj, configuration, platform, input):
     if obj.clean:
         out.rmtree_p()
 
-    with open(input, "rb") as f:
-        modules, class_dict, enum_dict = pickle.load(f)
-
-    render(settings, module_settings, modules, class_dict, obj.prefix, platform=platform)
+    if is_ir(input):
+        modules = open_ir(input, "transformed")
+        class_dict = modules["class_dict"]
+    else:
+        with open(input, "rb") as f:
+            modules, class_dict, enum_dict = pickle.load(f)
+
+    render(
+        settings,
+        module_settings,
+        modules,
+        class_dict,
+        obj.prefix,
+        platform=platform,
+        only=module or None,
+        n_jobs=obj.njobs,
+        cache=obj.cache,
+    )
 
     pre = settings["Extras"]["include_pre"]
     post = settings["Extras"]["include_pre"]
 
-    if pre:
-        (obj.prefix / Path(pre)).copy(out)
-    if post:
-        (obj.prefix / Path(post)).copy(out)
+    for p in (pre, post):
+        if p:
+            p = obj.prefix / Path(p)
+            write_if_changed(out / p.name, p.bytes(), p.stat().st_mode)
 
 
 @main.command()
@@ -140,6 +271,94 @@ def validate(obj, folder):
     validate_result(obj.verbose, obj.njobs, folder)
 
 
+@main.command()
+@click.argument("configuration")
+def precompile(configuration):
+    """Compile the templates used with CONFIGURATION (including template_path
+    overrides) to python modules in the precompiled_templates folder (default:
+    compiled folder next to the templates)"""
+
+    settings, module_mapping, module_settings = read_settings(configuration)
+
+    try:
+        target = precompile_templates(
+            template_paths(settings), precompiled_path(settings)
+        )
+    except ValueError as e:
+        raise click.ClickException(str(e))
+
+    logzero.logger.info(f"Templates compiled to {target}")
+
+
+@main.group()
+def symbols():
+    """Symbol table utilities"""
+
+
+@symbols.command()
+@click.argument("input", type=click.Path(True, True, True))
+@click.argument("output")
+@click.pass_obj
+def build(obj, input, output):
+    """Convert a symbols dump or the exports of shared libraries into a binary
+    symbol table"""
+
+    if os.path.isdir(input):
+        table = SymbolTable(read_library_exports(find_libraries(input), obj.cache))
+    elif is_library(input):
+        table = SymbolTable(read_library_exports([input], obj.cache))
+    else:
+        table = read_symbols(input)
+
+    table.save(output)
+
+    logzero.logger.info(f"{len(table)} symbols written to {output}")
+
+
+@main.group()
+def ir():
+    """Intermediate representation utilities"""
+
+
+@ir.command()
+@click.argument("input", type=click.Path(True, True, True))
+@click.option("-r", "--repeat", default=3, type=int)
+def bench(input, repeat):
+    """Compare size, dump/load and lookup times of the IR formats on INPUT (a .pkl
+    file or an IR folder)"""
+
+    if is_ir(input):
+        modules = list(IR(input))
+    else:
+        with open(input, "rb") as f:
+            modules = pickle.load(f)
+
+        # transformed modules are stored with the class and enum dicts
+        if isinstance(modules, tuple):
+            modules = modules[0]
+
+    for row in benchmark(modules, repeat):
+        click.echo(
+            "{format:>10}: {mb:8.1f} MB  dump {dump:7.3f} s  load {load:7.3f} s  "
+            "lookup {lookup:7.4f} s".format(mb=row["size"] / 2 ** 20, **row)
+        )
+
+
+def read_dependencies(input):
+    """Dependencies between the transformed modules in INPUT
+    """
+
+    if is_ir(input):
+        summaries = open_ir(input, "transformed").summaries
+    else:
+        with open(input, "rb") as f:
+            modules, _, _ = pickle.load(f)
+
+        summaries = ModuleSet(modules).summaries
+
+    return {name: s.get("dependencies", []) for name, s in summaries.items()}
+
+
 @main.command()
 @click.argument("configuration")
 @click.argument(
@@ -150,14 +369,97 @@ def validate(obj, folder):
 )
 @click.argument("tmp_parsed", default="tmp.pkl")
 @click.argument("tmp_filtered", default="tmp_filtered.pkl")
+@click.option(
+    "-u",
+    "--umbrella",
+    is_flag=True,
+    help="Parse all headers of a module in a single translation unit",
+)
+@click.option(
+    "--plan",
+    "plan_only",
+    is_flag=True,
+    help="Only show what would be redone and its estimated cost",
+)
 @click.pass_context
-def all(ctx, configuration, platform, tmp_parsed, tmp_filtered):
-
-    ctx.invoke(parse, configuration=configuration, output=tmp_parsed, platform=platform)
-    ctx.invoke(
-        transform, configuration=configuration, input=tmp_parsed, output=tmp_filtered, platform=platform
+def all(ctx, configuration, platform, tmp_parsed, tmp_filtered, umbrella, plan_only):
+    """Parse, transform and generate; with a cache only the stages and modules
+    affected by changes of the settings, headers, templates or bindgen itself
+    since the previous run are redone"""
+
+    obj = ctx.obj
+    outputs = dict(
+        parsed=os.path.abspath(tmp_parsed), transformed=os.path.abspath(tmp_filtered)
     )
-    ctx.invoke(generate, configuration=configuration, input=tmp_filtered, platform=platform)
+
+    new = snapshot(configuration, platform, umbrella, obj.prefix)
+    old = load_state(obj.cache) if obj.cache and not obj.clean else None
+
+    # the previous results are needed to redo only a part of the work
+    if old and (
+        old["outputs"] != outputs
+        or not (os.path.exists(tmp_parsed) and os.path.exists(tmp_filtered))
+    ):
+        old = None
+
+    plan = make_plan(old, new, lambda: read_dependencies(tmp_filtered))
+    times = old["times"] if old else {}
+
+    if plan_only:
+        settings = new["settings"]
+
+        with obj.prefix:
+            files = find_module_files(
+                Path(settings["input_folder"]),
+                plan.modules,
+                settings["pats"],
+                settings["exclude"],
+            )
+
+        timings = load_timings(obj.cache) if obj.cache else {}
+        click.echo(describe(plan, estimate(plan, files, timings, times)))
+
+        return
+
+    for reason in plan.reasons:
+        logzero.logger.info(reason)
+
+    def _run(stage, n, cmd, **kwargs):
+
+        t0 = perf_counter()
+        ctx.invoke(cmd, configuration=configuration, platform=platform, **kwargs)
+
+        # only complete runs give representative times per module
+        if n == len(plan.modules):
+            times[stage] = (perf_counter() - t0, n)
+
+    if plan.reparse:
+        _run(
+            "parse",
+            len(plan.reparse),
+            parse,
+            output=tmp_parsed,
+            umbrella=umbrella,
+        )
+    if plan.retransform:
+        _run(
+            "transform",
+            len(plan.retransform),
+            transform,
+            input=tmp_parsed,
+            output=tmp_filtered,
+        )
+    if plan.rerender:
+        _run(
+            "render",
+            len(plan.rerender),
+            generate,
+            input=tmp_filtered,
+            module=() if plan.render_all else tuple(sorted(plan.rerender)),
+        )
+
+    if obj.cache:
+        save_state(obj.cache, dict(new, outputs=outputs, times=times))
 
 
 if __name__ == "__main__":
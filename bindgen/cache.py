@@ -0,0 +1,274 @@
+import os
+import json
+import pickle
+
+from typing import Optional
+from tempfile import NamedTemporaryFile
+
+from logzero import logger
+from path import Path
+
+from .header import get_tu_options
+from .shards import Shard
+from .translation_unit import get_args, get_source, get_umbrella_source
+from .utils import (
+    get_clang_version,
+    digest,
+    object_digest,
+    file_digest,
+    includes_valid,
+)
+
+# sources influencing the parsing results
+SOURCES = ("header.py", "translation_unit.py", "type_parser.py", "utils.py", "cymbal.py")
+
+# sources influencing the transformation results, this must list every module
+# transform_module (and the helpers it calls) imports from
+TRANSFORM_SOURCES = (
+    "__init__.py",
+    "matchers.py",
+    "module.py",
+    "header.py",
+    "symbols.py",
+    "type_parser.py",
+    "utils.py",
+)
+
+_version = None
+_transform_version = None
+
+
+def get_version():
+    """Version of bindgen and libclang used to invalidate cached results
+    """
+
+    global _version
+
+    if _version is None:
+        root = Path(__file__).dirname()
+        _version = digest(
+            get_clang_version(), [file_digest(root / s) for s in SOURCES]
+        )
+
+    return _version
+
+
+def get_transform_version():
+    """Version of the transformation code used to invalidate cached modules
+    """
+
+    global _transform_version
+
+    if _transform_version is None:
+        root = Path(__file__).dirname()
+        _transform_version = digest([file_digest(root / s) for s in TRANSFORM_SOURCES])
+
+    return _transform_version
+
+
+def atomic_dump(obj, p):
+    """Pickle obj to p such that concurrent readers never see partial files
+    """
+
+    p = Path(p)
+    p.dirname().makedirs_p()
+
+    with NamedTemporaryFile("wb", dir=p.dirname(), delete=False) as f:
+        pickle.dump(obj, f)
+
+    os.replace(f.name, p)
+
+
+def prune(root, max_size):
+    """Remove the least recently used ASTs from root until it fits in max_size
+    """
+
+    files = sorted(
+        Path(root).walkfiles("*.ast"),
+        key=lambda f: f.mtime,
+        reverse=True,
+    )
+
+    size = 0
+    removed = 0
+    for f in files:
+        size += f.size
+        if size > max_size:
+            f.remove_p()
+            f.with_suffix(".pkl").remove_p()
+            removed += 1
+
+    if removed:
+        logger.info(f"Removed {removed} files from {root}")
+
+
+def load_timings(root):
+    """Per-header parsing times recorded in previous runs
+    """
+
+    p = Path(root) / "timings.json"
+
+    if not p.exists():
+        return {}
+
+    with open(p) as f:
+        return json.load(f)
+
+
+def save_timings(root, timings):
+
+    p = Path(root) / "timings.json"
+    p.dirname().makedirs_p()
+
+    with NamedTemporaryFile("w", dir=p.dirname(), delete=False) as f:
+        json.dump(timings, f, indent=0, sort_keys=True)
+
+    os.replace(f.name, p)
+
+
+class HeaderCache(object):
+    """Content-addressed cache of HeaderInfo objects
+
+    Entries are keyed by the header source (including all parsing headers),
+    clang arguments and bindgen version. The transitive includes are stored
+    with every entry and validated on load. Umbrella TUs are cached as a
+    single entry holding the HeaderInfo objects of all included headers.
+    """
+
+    root: Path
+    pch: Path
+    ast: Optional[Path]
+    hits: int
+
+    def __init__(self, root, ast=False):
+
+        self.root = Path(root) / "headers"
+        self.pch = Path(root) / "pch"
+        self.ast = Path(root) / "ast" if ast else None
+        self.hits = 0
+
+    def _path(self, key):
+
+        return self.root / key[:2] / key + ".pkl"
+
+    def key(self, path, input_folder, settings, module_name):
+        """Key of a header or of a list of headers parsed as an umbrella TU
+        """
+
+        umbrella = isinstance(path, list)
+        options = get_tu_options(
+            None if umbrella else path, settings, module_name
+        )
+
+        args = get_args(input_folder, options["prefix"], options["platform_includes"])
+        source = (get_umbrella_source if umbrella else get_source)(
+            path,
+            options["parsing_header"],
+            options["tu_parsing_header"],
+            options["platform_parsing_header"],
+        )
+
+        return digest(
+            path, args, source, settings["exclude_namespaces"], get_version()
+        )
+
+    def load(self, key):
+        """Cached HeaderInfo (or list of them) if all its includes are unchanged
+        """
+
+        p = self._path(key)
+
+        if not p.exists():
+            return None
+
+        try:
+            with open(p, "rb") as f:
+                includes, hi = pickle.load(f)
+        except Exception:
+            logger.warning(f"Corrupted cache entry {p}")
+            return None
+
+        if not includes_valid(includes):
+            return None
+
+        logger.debug(f"Cache hit {key}")
+        self.hits += 1
+
+        return hi
+
+    def store(self, key, hi, tr_unit):
+
+        includes = sorted(
+            set(inc for _, inc in tr_unit.inclusions)
+            | set(inc for _, inc in tr_unit.pch_inclusions)
+        )
+
+        atomic_dump(([(p, file_digest(p)) for p in includes], hi), self._path(key))
+
+
+class TransformCache(object):
+    """Cache of transformed modules
+
+    Entries are keyed by the digest of the parsed module, its module settings,
+    the global transformation settings, the symbol table and the version of
+    the transformation code. Every entry consists of the pickled module and a
+    summary with the module name, class_dict, class and enum names. The summary
+    is written last and marks the entry as complete.
+    """
+
+    root: Path
+    hits: int
+
+    def __init__(self, root):
+
+        self.root = Path(root) / "transform"
+        self.hits = 0
+
+    def _path(self, key):
+
+        return self.root / key[:2] / key + ".pkl"
+
+    def _module_path(self, key):
+
+        return self.root / key[:2] / key + ".module.pkl"
+
+    def key(self, module_digest, module_settings, global_settings, sym):
+
+        # settings are hashed independently of the order of their keys
+        return object_digest(
+            (
+                module_digest,
+                module_settings,
+                global_settings,
+                sym.digest,
+                get_transform_version(),
+            )
+        )
+
+    def load(self, key):
+        """Shard of the cached module and its summary
+        """
+
+        p = self._path(key)
+
+        if not p.exists() or not self._module_path(key).exists():
+            return None
+
+        try:
+            with open(p, "rb") as f:
+                summary = pickle.load(f)
+        except Exception:
+            logger.warning(f"Corrupted cache entry {p}")
+            return None
+
+        logger.debug(f"Cache hit {key}")
+        self.hits += 1
+
+        return (Shard(self._module_path(key)), *summary)
+
+    def store(self, key, m, *summary):
+
+        atomic_dump(m, self._module_path(key))
+        atomic_dump(summary, self._path(key))
+
+        return (Shard(self._module_path(key)), *summary)
@@ -0,0 +1,742 @@
+import os
+import mmap
+import struct
+
+from array import array
+from bisect import bisect_left
+from hashlib import sha256
+from functools import lru_cache
+from importlib import import_module
+from keyword import iskeyword
+from typing import Any, Dict, List, Tuple
+
+from path import Path
+
+# columnar IR layout (native byte order, checked with ORDER):
+#   header: MAGIC, VERSION, ORDER, root value, element count of every section
+#   sections (each padded to 8 bytes):
+#     strings: utf-8 encoded, NUL separated interned strings
+#     kinds, data: one entry per distinct value - its kind and payload; atoms
+#       come first grouped by kind, followed by the containers in order of
+#       allocation (tuples always follow their elements)
+#     ints: int64 payloads of INT values
+#     floats: float64 payloads of FLOAT values
+#     spans: (start, count) into items per container value
+#     items: value ids of container elements (dicts store keys and values)
+#     classes: "module:qualname" string ids of the classes of all objects
+#     layout_class, layout_start, layout_fields: class and field names
+#       (string ids) of every distinct attribute layout
+#     obj_layout, obj_offset: layout and start in fields of every object
+#     fields: value ids of the attributes of all objects
+#
+# Reader decodes values on demand from a mapped file, e.g. single classes of
+# other modules for the templates, without reconstructing the whole module.
+#
+# Strings, None/bools, ints, floats and tuples are stored once by value.
+# Lists, sets, dicts and objects are stored once per identity, so shared and
+# recursive references survive a round trip. Classes are only resolved within
+# the bindgen package.
+#
+# Limitations, unlike pickle: strings containing NUL raise ValueError (they
+# would break the NUL separated string table) and ints outside the int64 range
+# raise OverflowError. Neither occurs in parsed modules, where strings come
+# from C++ source and ints are small.
+MAGIC = b"BGIRDATA"
+VERSION = 2
+SUFFIX = ".bgir"
+ORDER = 0x01020304
+
+SECTIONS = (
+    ("strings", "B"),
+    ("kinds", "B"),
+    ("data", "I"),
+    ("ints", "q"),
+    ("floats", "d"),
+    ("spans", "I"),
+    ("items", "I"),
+    ("classes", "I"),
+    ("layout_class", "I"),
+    ("layout_start", "I"),
+    ("layout_fields", "I"),
+    ("obj_layout", "I"),
+    ("obj_offset", "I"),
+    ("fields", "I"),
+)
+
+HEADER = struct.Struct(f"8sIII{len(SECTIONS)}Q")
+
+NONE, FALSE, TRUE, INT, FLOAT, STR, PATH, OBJ, TUPLE, LIST, SET, DICT = range(12)
+
+CONTAINERS = {list: LIST, set: SET, dict: DICT}
+
+PACKAGE = __name__.rsplit(".", 1)[0]
+
+
+@lru_cache(maxsize=None)
+def _slots(cls) -> Tuple[str, ...]:
+
+    return tuple(name for c in cls.__mro__ for name in c.__dict__.get("__slots__", ()))
+
+
+def _state(obj) -> Dict[str, Any]:
+    """Attributes of obj including slots
+    """
+
+    rv = dict(getattr(obj, "__dict__", {}))
+
+    for name in _slots(type(obj)):
+        if name not in rv and hasattr(obj, name):
+            rv[name] = getattr(obj, name)
+
+    return rv
+
+
+class _Encoder(object):
+    """Flatten an object graph into interned strings and typed arrays
+    """
+
+    def __init__(self):
+
+        self.strings = {}
+        self.str_values = {}
+        self.values = {}
+        self.memo = {}
+        self.alive = []
+        self.tuples = set()
+        self.classes = {}
+        self.layouts = {}
+
+        self.arrays = {name: array(typecode) for name, typecode in SECTIONS}
+        self.arrays["layout_start"].append(0)
+
+    def string(self, s: str) -> int:
+
+        rv = self.strings.get(s)
+
+        if rv is None:
+            if "\0" in s:
+                raise ValueError(f"Cannot store strings containing NUL: {s!r}")
+            rv = self.strings[s] = len(self.strings)
+
+        return rv
+
+    def _new(self, kind: int, data: int) -> int:
+
+        rv = len(self.arrays["kinds"])
+        self.arrays["kinds"].append(kind)
+        self.arrays["data"].append(data)
+
+        return rv
+
+    def _const(self, kind: int, data: int) -> int:
+
+        key = (kind, data)
+        rv = self.values.get(key)
+
+        if rv is None:
+            rv = self.values[key] = self._new(kind, data)
+
+        return rv
+
+    def _span(self, ids: List[int]) -> int:
+
+        spans = self.arrays["spans"]
+        rv = len(spans) // 2
+
+        spans.append(len(self.arrays["items"]))
+        spans.append(len(ids))
+        self.arrays["items"].extend(ids)
+
+        return rv
+
+    def _layout(self, cls, names: Tuple[str, ...]) -> int:
+
+        key = (cls, names)
+        rv = self.layouts.get(key)
+
+        if rv is None:
+            if cls not in self.classes:
+                self.classes[cls] = len(self.classes)
+                self.arrays["classes"].append(
+                    self.string(f"{cls.__module__}:{cls.__qualname__}")
+                )
+
+            rv = self.layouts[key] = len(self.layouts)
+            self.arrays["layout_class"].append(self.classes[cls])
+            self.arrays["layout_fields"].extend(self.string(n) for n in names)
+            self.arrays["layout_start"].append(len(self.arrays["layout_fields"]))
+
+        return rv
+
+    def encode(self, obj) -> int:
+        """Value id of obj
+        """
+
+        # strings are by far the most common values
+        if type(obj) is str:
+            rv = self.str_values.get(obj)
+
+            if rv is None:
+                rv = self.str_values[obj] = self._new(STR, self.string(obj))
+
+            return rv
+
+        # ids of memoized objects are not reused, they are kept alive
+        rv = self.memo.get(id(obj))
+        if rv is not None:
+            return rv
+
+        if obj is None:
+            return self._const(NONE, 0)
+        elif obj is False:
+            return self._const(FALSE, 0)
+        elif obj is True:
+            return self._const(TRUE, 0)
+        elif type(obj) is int:
+            ints = self.arrays["ints"]
+            key = (INT, obj)
+
+            if key not in self.values:
+                self.values[key] = self._new(INT, len(ints))
+                ints.append(obj)
+
+            return self.values[key]
+        elif type(obj) is float:
+            floats = self.arrays["floats"]
+            key = (FLOAT, obj.hex())
+
+            if key not in self.values:
+                self.values[key] = self._new(FLOAT, len(floats))
+                floats.append(obj)
+
+            return self.values[key]
+        elif isinstance(obj, Path):
+            return self._const(PATH, self.string(obj))
+        elif type(obj) is tuple:
+            # tuples are stored by value, i.e. once their elements are known
+            if id(obj) in self.tuples:
+                raise ValueError("Cannot store tuples containing themselves")
+
+            self.tuples.add(id(obj))
+            try:
+                ids = tuple(self.encode(el) for el in obj)
+            finally:
+                self.tuples.discard(id(obj))
+
+            key = (TUPLE, ids)
+
+            if key not in self.values:
+                self.values[key] = self._new(TUPLE, self._span(ids))
+
+            return self.values[key]
+
+        self.alive.append(obj)
+
+        if type(obj) in CONTAINERS:
+            # allocated before the elements - shared and recursive containers
+            # are stored once
+            rv = self.memo[id(obj)] = self._new(CONTAINERS[type(obj)], 0)
+
+            if type(obj) is dict:
+                ids = []
+                for k, v in obj.items():
+                    ids.append(self.encode(k))
+                    ids.append(self.encode(v))
+            else:
+                ids = [self.encode(el) for el in obj]
+
+            self.arrays["data"][rv] = self._span(ids)
+        elif type(obj).__module__.split(".")[0] == PACKAGE:
+            rv = self._object(obj)
+        else:
+            raise TypeError(f"Cannot store objects of type {type(obj)}")
+
+        return rv
+
+    def _object(self, obj) -> int:
+
+        obj_offset = self.arrays["obj_offset"]
+        oid = len(obj_offset)
+
+        # allocated before the attributes - cycles through objects are allowed
+        rv = self.memo[id(obj)] = self._new(OBJ, oid)
+        obj_offset.append(0)
+        self.arrays["obj_layout"].append(0)
+
+        state = _state(obj)
+        ids = [self.encode(v) for v in state.values()]
+
+        self.arrays["obj_layout"][oid] = self._layout(type(obj), tuple(state))
+        obj_offset[oid] = len(self.arrays["fields"])
+        self.arrays["fields"].extend(ids)
+
+        return rv
+
+    def _sort_values(self, root: int) -> int:
+        """Renumber the values such that atoms come first grouped by kind
+        """
+
+        kinds = self.arrays["kinds"]
+        data = self.arrays["data"]
+
+        order = sorted(range(len(kinds)), key=lambda i: (min(kinds[i], TUPLE), i))
+        remap = array("I", bytes(4 * len(order)))
+        for new, old in enumerate(order):
+            remap[old] = new
+
+        self.arrays["kinds"] = array("B", (kinds[i] for i in order))
+        self.arrays["data"] = array("I", (data[i] for i in order))
+
+        for name in ("items", "fields"):
+            self.arrays[name] = array("I", (remap[i] for i in self.arrays[name]))
+
+        return remap[root]
+
+    def tobytes(self, root: int) -> bytes:
+
+        root = self._sort_values(root)
+        self.arrays["strings"] = array("B", "\0".join(self.strings).encode())
+
+        header = HEADER.pack(
+            MAGIC, VERSION, ORDER, root, *(len(self.arrays[name]) for name, _ in SECTIONS)
+        )
+        rv = [header, _padding(len(header))]
+
+        for name, _ in SECTIONS:
+            data = self.arrays[name].tobytes()
+            rv.append(data)
+            rv.append(_padding(len(data)))
+
+        return b"".join(rv)
+
+
+def _padding(n: int) -> bytes:
+
+    return b"\0" * (-n % 8)
+
+
+@lru_cache(maxsize=None)
+def _resolve(name: str):
+
+    module, qualname = name.split(":")
+
+    if module.split(".")[0] != PACKAGE:
+        raise ValueError(f"Refusing to load class {name}")
+
+    rv = import_module(module)
+    for el in qualname.split("."):
+        rv = getattr(rv, el)
+
+    return rv
+
+
+@lru_cache(maxsize=None)
+def _setter(names: Tuple[str, ...]):
+    """Function assigning a list of values to the attributes names of an object
+
+    The assignment is generated as a single statement, which is much faster
+    than calling setattr per attribute.
+    """
+
+    if not all(n.isidentifier() and not iskeyword(n) for n in names):
+
+        def setter(obj, values):
+
+            for name, value in zip(names, values):
+                setattr(obj, name, value)
+
+        return setter
+
+    if not names:
+        return lambda obj, values: None
+
+    ns = {}
+    targets = ", ".join(f"obj.{n}" for n in names)
+    exec(f"def setter(obj, values):\n    {targets}, = values\n", ns)
+
+    return ns["setter"]
+
+
+class Table(object):
+    """Zero-copy view of a columnar IR buffer
+
+    The sections are exposed as typed memoryviews, so e.g. the interned
+    strings or the class of every object can be queried without
+    reconstructing the object graph.
+    """
+
+    root: int
+    counts: Dict[str, int]
+
+    def __init__(self, buffer):
+
+        view = memoryview(buffer)
+        magic, version, order, self.root, *counts = HEADER.unpack_from(view)
+
+        if magic != MAGIC:
+            raise ValueError("Not a columnar IR")
+        if version != VERSION:
+            raise ValueError(f"Unsupported columnar IR version {version}")
+        if order != ORDER:
+            raise ValueError("Columnar IR was written with a different byte order")
+
+        self.counts = dict(zip((name for name, _ in SECTIONS), counts))
+        self.views = []
+
+        offset = HEADER.size + len(_padding(HEADER.size))
+
+        for (name, typecode), count in zip(SECTIONS, counts):
+            size = count * array(typecode).itemsize
+            section = view[offset : offset + size].cast(typecode)
+
+            setattr(self, name, section)
+            self.views.append(section)
+            offset += size + len(_padding(size))
+
+        view.release()
+
+    def release(self):
+        """Release all views into the buffer
+        """
+
+        for v in self.views:
+            v.release()
+
+    def get_strings(self) -> List[str]:
+
+        return bytes(self.strings).decode().split("\0") if self.counts["strings"] else [""]
+
+    def get_classes(self) -> List[str]:
+
+        strings = self.get_strings()
+
+        return [strings[i] for i in self.classes]
+
+    def decode(self):
+        """Reconstruct the stored object graph
+        """
+
+        strings = self.get_strings()
+        classes = [_resolve(strings[i]) for i in self.classes]
+        kinds = self.kinds.tolist()
+        data = self.data.tolist()
+        ints = self.ints.tolist()
+        floats = self.floats.tolist()
+        spans = self.spans.tolist()
+        items = self.items.tolist()
+
+        types = [classes[i] for i in self.layout_class]
+        objects = [types[layout].__new__(types[layout]) for layout in self.obj_layout.tolist()]
+
+        # atoms are grouped by kind and decoded in bulk
+        n = len(kinds)
+        atoms = bisect_left(self.kinds, TUPLE)
+        bounds = [bisect_left(self.kinds, k, 0, atoms) for k in range(TUPLE)] + [atoms]
+
+        def _run(kind):
+
+            return data[bounds[kind] : bounds[kind + 1]]
+
+        vals = [None] * (bounds[FALSE] - bounds[NONE])
+        vals += [False] * (bounds[TRUE] - bounds[FALSE])
+        vals += [True] * (bounds[INT] - bounds[TRUE])
+        vals += [ints[d] for d in _run(INT)]
+        vals += [floats[d] for d in _run(FLOAT)]
+        vals += [strings[d] for d in _run(STR)]
+        vals += [Path(strings[d]) for d in _run(PATH)]
+        vals += [objects[d] for d in _run(OBJ)]
+        vals += [None] * (n - atoms)
+
+        # mutable containers are created empty first and tuples follow their
+        # elements, so a single pass creates all containers
+        for i in range(atoms, n):
+            kind = kinds[i]
+
+            if kind == TUPLE:
+                start = spans[2 * data[i]]
+                vals[i] = tuple(
+                    [vals[j] for j in items[start : start + spans[2 * data[i] + 1]]]
+                )
+            elif kind == LIST:
+                vals[i] = []
+            elif kind == SET:
+                vals[i] = set()
+            else:
+                vals[i] = {}
+
+        # all values exist now, elements and attributes are resolved in bulk
+        elements = list(map(vals.__getitem__, items))
+
+        for i in range(atoms, n):
+            kind = kinds[i]
+
+            if kind == TUPLE:
+                continue
+
+            start = spans[2 * data[i]]
+            end = start + spans[2 * data[i] + 1]
+
+            if kind == LIST:
+                vals[i].extend(elements[start:end])
+            elif kind == SET:
+                vals[i].update(elements[start:end])
+            else:
+                keys = elements[start:end:2]
+                vals[i].update(zip(keys, elements[start + 1 : end : 2]))
+
+        layout_start = self.layout_start.tolist()
+        layout_fields = self.layout_fields.tolist()
+        layouts = [
+            tuple(strings[j] for j in layout_fields[layout_start[i] : layout_start[i + 1]])
+            for i in range(len(layout_start) - 1)
+        ]
+
+        attributes = list(map(vals.__getitem__, self.fields.tolist()))
+
+        setters = [_setter(names) for names in layouts]
+        sizes = [len(names) for names in layouts]
+
+        for obj, layout, offset in zip(
+            objects, self.obj_layout.tolist(), self.obj_offset.tolist()
+        ):
+            setters[layout](obj, attributes[offset : offset + sizes[layout]])
+
+        return vals[self.root]
+
+
+class Reader(Table):
+    """Lazy view of a columnar IR buffer decoding values on demand
+
+    Only the values reachable from the requested ones are reconstructed,
+    e.g. the classes of a module without its headers and functions. Values
+    are decoded once per reader, so shared references are preserved.
+    """
+
+    def __init__(self, buffer, mapped=None):
+
+        super().__init__(buffer)
+
+        # mmap closed with the reader
+        self.buffer = mapped
+        self.string_list = self.get_strings()
+        self.types = {}
+        self.layouts = {}
+        self.memo = {}
+
+    def _type(self, layout: int):
+
+        rv = self.types.get(layout)
+
+        if rv is None:
+            cls = self.classes[self.layout_class[layout]]
+            rv = self.types[layout] = _resolve(self.string_list[cls])
+
+        return rv
+
+    def _layout(self, layout: int) -> Tuple[str, ...]:
+
+        rv = self.layouts.get(layout)
+
+        if rv is None:
+            fields = self.layout_fields[
+                self.layout_start[layout] : self.layout_start[layout + 1]
+            ]
+            rv = self.layouts[layout] = tuple(self.string_list[j] for j in fields)
+
+        return rv
+
+    def _elements(self, d: int) -> List[int]:
+
+        start, count = self.spans[2 * d], self.spans[2 * d + 1]
+
+        return self.items[start : start + count].tolist()
+
+    def value(self, i: int):
+        """Decode the value with id i and everything reachable from it
+        """
+
+        if i in self.memo:
+            return self.memo[i]
+
+        kind, d = self.kinds[i], self.data[i]
+
+        if kind == NONE:
+            return None
+        elif kind == FALSE:
+            return False
+        elif kind == TRUE:
+            return True
+        elif kind == INT:
+            return self.ints[d]
+        elif kind == FLOAT:
+            return self.floats[d]
+        elif kind == STR:
+            return self.string_list[d]
+        elif kind == PATH:
+            return Path(self.string_list[d])
+        elif kind == TUPLE:
+            rv = self.memo[i] = tuple(self.value(j) for j in self._elements(d))
+            return rv
+
+        # registered before the elements are decoded - cycles are allowed
+        if kind == OBJ:
+            layout = self.obj_layout[d]
+            cls = self._type(layout)
+            rv = self.memo[i] = cls.__new__(cls)
+            names = self._layout(layout)
+            offset = self.obj_offset[d]
+            ids = self.fields[offset : offset + len(names)].tolist()
+
+            _setter(names)(rv, [self.value(j) for j in ids])
+        elif kind == LIST:
+            rv = self.memo[i] = []
+            rv.extend(self.value(j) for j in self._elements(d))
+        elif kind == SET:
+            rv = self.memo[i] = set()
+            rv.update(self.value(j) for j in self._elements(d))
+        else:
+            rv = self.memo[i] = {}
+            els = [self.value(j) for j in self._elements(d)]
+            rv.update(zip(els[::2], els[1::2]))
+
+        return rv
+
+    def field_id(self, i: int, name: str) -> int:
+        """Value id of the attribute name of the object with value id i
+        """
+
+        if self.kinds[i] != OBJ:
+            raise TypeError(f"Value {i} is not an object")
+
+        oid = self.data[i]
+        names = self._layout(self.obj_layout[oid])
+
+        if name not in names:
+            raise AttributeError(name)
+
+        return self.fields[self.obj_offset[oid] + names.index(name)]
+
+    def field(self, i: int, name: str):
+        """Decode a single attribute of the object with value id i
+        """
+
+        return self.value(self.field_id(i, name))
+
+    def index(self, i: int, key: str = "name") -> "LazyMapping":
+        """Objects of the list with value id i by their key attribute
+
+        Only the keys are decoded, the objects on first access.
+        """
+
+        if self.kinds[i] not in (LIST, TUPLE):
+            raise TypeError(f"Value {i} is not a list")
+
+        ids = self._elements(self.data[i])
+
+        return LazyMapping(self, {self.field(j, key): j for j in ids})
+
+    def close(self):
+
+        self.release()
+
+        if self.buffer is not None:
+            self.buffer.close()
+            self.buffer = None
+
+
+class LazyMapping(object):
+    """Read-only mapping of keys to objects decoded on demand by a Reader
+    """
+
+    def __init__(self, reader: Reader, ids: Dict[Any, int]):
+
+        self.reader = reader
+        self.ids = ids
+
+    def __contains__(self, key):
+
+        return key in self.ids
+
+    def __getitem__(self, key):
+
+        return self.reader.value(self.ids[key])
+
+    def get(self, key, default=None):
+
+        return self[key] if key in self.ids else default
+
+    def keys(self):
+
+        return self.ids.keys()
+
+    def __len__(self):
+
+        return len(self.ids)
+
+
+def dumps(obj) -> bytes:
+    """Serialize obj in the columnar IR format
+    """
+
+    encoder = _Encoder()
+    root = encoder.encode(obj)
+
+    return encoder.tobytes(root)
+
+
+def loads(data: bytes):
+
+    table = Table(data)
+
+    try:
+        return table.decode()
+    finally:
+        table.release()
+
+
+def dump(obj, p):
+
+    tmp = f"{p}.tmp.{os.getpid()}"
+
+    with open(tmp, "wb") as f:
+        f.write(dumps(obj))
+
+    os.replace(tmp, p)
+
+
+def load(p):
+    """Load a columnar IR file via mmap
+    """
+
+    with open(p, "rb") as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    try:
+        return loads(mm)
+    finally:
+        mm.close()
+
+
+def open_reader(p, digest=None) -> Reader:
+    """Map the file p for lazy access, close the reader when done
+
+    With a digest the file is checked against its sha256 first.
+    """
+
+    with open(p, "rb") as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    try:
+        if digest and sha256(mm).hexdigest() != digest:
+            raise ValueError(f"{p} does not match its digest")
+
+        return Reader(mm, mm)
+    except BaseException:
+        mm.close()
+        raise
+
+
+def is_columnar(p):
+
+    with open(p, "rb") as f:
+        return f.read(len(MAGIC)) == MAGIC
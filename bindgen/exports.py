@@ -0,0 +1,311 @@
+import os
+import pickle
+import struct
+
+from typing import Dict, List, Tuple
+
+from logzero import logger
+from path import Path
+
+from .utils import file_digest
+
+# ELF
+ELF_MAGIC = b"\x7fELF"
+SHT_DYNSYM = 11
+SHN_UNDEF = 0
+STB_EXPORTED = (1, 2, 10)  # GLOBAL, WEAK, GNU_UNIQUE
+STV_EXPORTED = (0, 3)  # DEFAULT, PROTECTED
+
+# PE
+PE_MAGIC = b"MZ"
+PE_SIGNATURE = b"PE\0\0"
+PE32 = 0x10B
+PE32_PLUS = 0x20B
+
+# Mach-O
+MACHO_MAGICS = {
+    b"\xfe\xed\xfa\xce": (">", False),
+    b"\xce\xfa\xed\xfe": ("<", False),
+    b"\xfe\xed\xfa\xcf": (">", True),
+    b"\xcf\xfa\xed\xfe": ("<", True),
+}
+FAT_MAGICS = {b"\xca\xfe\xba\xbe": False, b"\xca\xfe\xba\xbf": True}
+LC_SYMTAB = 0x2
+N_STAB = 0xE0
+N_TYPE = 0x0E
+N_EXT = 0x01
+N_SECT = 0x0E
+
+
+def _cstr(data, offset):
+
+    return data[offset : data.index(b"\0", offset)].decode(errors="replace")
+
+
+def read_elf_exports(data: bytes) -> List[str]:
+    """Defined global symbols of the .dynsym section of an ELF shared library
+    """
+
+    is64 = data[4] == 2
+    e = "<" if data[5] == 1 else ">"
+
+    if is64:
+        shoff, = struct.unpack_from(e + "Q", data, 0x28)
+        shentsize, shnum = struct.unpack_from(e + "HH", data, 0x3A)
+        shdr = struct.Struct(e + "IIQQQQIIQQ")
+        sym = struct.Struct(e + "IBBHQQ")
+    else:
+        shoff, = struct.unpack_from(e + "I", data, 0x20)
+        shentsize, shnum = struct.unpack_from(e + "HH", data, 0x2E)
+        shdr = struct.Struct(e + "IIIIIIIIII")
+        sym = struct.Struct(e + "IIIBBH")
+
+    sections = [shdr.unpack_from(data, shoff + i * shentsize) for i in range(shnum)]
+
+    rv = []
+    for _, sh_type, _, _, offset, size, link, _, _, entsize in sections:
+        if sh_type != SHT_DYNSYM:
+            continue
+
+        strtab = sections[link][4]
+
+        for i in range(1, size // entsize):
+            fields = sym.unpack_from(data, offset + i * entsize)
+
+            if is64:
+                name, info, other, shndx, _, _ = fields
+            else:
+                name, _, _, info, other, shndx = fields
+
+            if (
+                shndx != SHN_UNDEF
+                and info >> 4 in STB_EXPORTED
+                and other & 0x3 in STV_EXPORTED
+            ):
+                rv.append(_cstr(data, strtab + name))
+
+    return rv
+
+
+def read_pe_exports(data: bytes) -> List[str]:
+    """Names in the export directory of a PE (DLL) file
+    """
+
+    pe, = struct.unpack_from("<I", data, 0x3C)
+
+    if data[pe : pe + 4] != PE_SIGNATURE:
+        raise ValueError("Not a PE file")
+
+    nsections, = struct.unpack_from("<H", data, pe + 6)
+    opt_size, = struct.unpack_from("<H", data, pe + 20)
+    opt = pe + 24
+
+    magic, = struct.unpack_from("<H", data, opt)
+    if magic == PE32:
+        ndirs, export_rva, export_size = struct.unpack_from("<III", data, opt + 92)
+    elif magic == PE32_PLUS:
+        ndirs, export_rva, export_size = struct.unpack_from("<III", data, opt + 108)
+    else:
+        raise ValueError("Unknown PE optional header")
+
+    if ndirs == 0 or export_rva == 0:
+        return []
+
+    sections = [
+        struct.unpack_from("<IIII", data, opt + opt_size + i * 40 + 8)
+        for i in range(nsections)
+    ]
+
+    def _offset(rva):
+
+        for vsize, vaddr, rawsize, rawptr in sections:
+            if vaddr <= rva < vaddr + max(vsize, rawsize):
+                return rva - vaddr + rawptr
+
+        raise ValueError(f"RVA {rva:#x} not mapped")
+
+    export = _offset(export_rva)
+    nnames, names = struct.unpack_from("<I4xI", data, export + 24)
+
+    names = _offset(names)
+
+    return [
+        _cstr(data, _offset(struct.unpack_from("<I", data, names + 4 * i)[0]))
+        for i in range(nnames)
+    ]
+
+
+def read_macho_exports(data: bytes, offset: int = 0) -> List[str]:
+    """Defined external symbols of a (possibly universal) Mach-O library
+    """
+
+    magic = data[offset : offset + 4]
+
+    # universal binary - union of all architectures
+    if magic in FAT_MAGICS:
+        is64 = FAT_MAGICS[magic]
+        nfat, = struct.unpack_from(">I", data, offset + 4)
+        arch = struct.Struct(">iiQQI4x" if is64 else ">iiIII")
+
+        rv = set()
+        for i in range(nfat):
+            _, _, arch_offset, _, _ = arch.unpack_from(data, offset + 8 + i * arch.size)
+            rv.update(read_macho_exports(data, arch_offset))
+
+        return sorted(rv)
+
+    e, is64 = MACHO_MAGICS[magic]
+
+    ncmds, = struct.unpack_from(e + "I", data, offset + 16)
+    cmd = offset + (32 if is64 else 28)
+    nlist = struct.Struct(e + ("IBBHQ" if is64 else "IBBHI"))
+
+    rv = []
+    for _ in range(ncmds):
+        cmd_type, cmd_size = struct.unpack_from(e + "II", data, cmd)
+
+        if cmd_type == LC_SYMTAB:
+            symoff, nsyms, stroff, _ = struct.unpack_from(e + "IIII", data, cmd + 8)
+
+            for i in range(nsyms):
+                strx, n_type, _, _, _ = nlist.unpack_from(
+                    data, offset + symoff + i * nlist.size
+                )
+
+                if (
+                    not n_type & N_STAB
+                    and n_type & N_EXT
+                    and n_type & N_TYPE == N_SECT
+                ):
+                    rv.append(_cstr(data, offset + stroff + strx))
+
+        cmd += cmd_size
+
+    return rv
+
+
+def _format(f):
+    """Format of the library opened as f based on its magic, None if unknown
+    """
+
+    magic = f.read(4)
+
+    if magic == ELF_MAGIC:
+        return "elf"
+    elif magic in MACHO_MAGICS or magic in FAT_MAGICS:
+        return "macho"
+    elif magic[:2] == PE_MAGIC:
+        # MZ alone also starts DOS executables and random data files
+        f.seek(0x3C)
+        offset = f.read(4)
+
+        if len(offset) == 4:
+            f.seek(struct.unpack("<I", offset)[0])
+
+            if f.read(4) == PE_SIGNATURE:
+                return "pe"
+
+    return None
+
+
+def read_exports(p) -> List[str]:
+    """Exported symbols of a shared library, the format is detected from its magic
+    """
+
+    with open(p, "rb") as f:
+        fmt = _format(f)
+        f.seek(0)
+        data = f.read()
+
+    if fmt == "elf":
+        return read_elf_exports(data)
+    elif fmt == "pe":
+        return read_pe_exports(data)
+    elif fmt == "macho":
+        return read_macho_exports(data)
+
+    raise ValueError(f"{p} is not a shared library")
+
+
+def is_library(p):
+    """Check if p looks like a shared library based on its magic
+    """
+
+    with open(p, "rb") as f:
+        return _format(f) is not None
+
+
+def find_libraries(folder):
+    """Shared libraries in a folder
+    """
+
+    return sorted(
+        p for p in Path(folder).files() if not os.path.islink(p) and is_library(p)
+    )
+
+
+class ExportsCache(object):
+    """Exported symbols per library
+
+    Entries are reused while the mtime and size of the library are unchanged.
+    Otherwise the content digest decides if the library needs to be read again.
+    """
+
+    path: Path
+    entries: Dict[str, Tuple[int, int, str, List[str]]]
+
+    def __init__(self, root):
+
+        self.path = Path(root) / "exports.pkl"
+        self.entries = {}
+
+        if self.path.exists():
+            with open(self.path, "rb") as f:
+                self.entries = pickle.load(f)
+
+    def get(self, p):
+
+        p = os.path.abspath(p)
+        st = os.stat(p)
+        entry = self.entries.get(p)
+
+        if entry and entry[:2] == (st.st_mtime_ns, st.st_size):
+            return entry[3]
+
+        digest = file_digest(p)
+
+        if entry and entry[2] == digest:
+            names = entry[3]
+        else:
+            logger.debug(f"Reading exports of {p}")
+            names = read_exports(p)
+
+        self.entries[p] = (st.st_mtime_ns, st.st_size, digest, names)
+
+        return names
+
+    def save(self):
+
+        self.path.dirname().makedirs_p()
+        tmp = f"{self.path}.tmp.{os.getpid()}"
+
+        with open(tmp, "wb") as f:
+            pickle.dump(self.entries, f)
+
+        os.replace(tmp, self.path)
+
+
+def read_library_exports(paths, cache=None):
+    """Exported symbols of all libraries (optionally cached)
+    """
+
+    exports_cache = ExportsCache(cache) if cache else None
+
+    rv = []
+    for p in paths:
+        rv.extend(exports_cache.get(p) if exports_cache else read_exports(p))
+
+    if exports_cache:
+        exports_cache.save()
+
+    return rv
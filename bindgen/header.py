@@ -1,30 +1,60 @@
-from typing import List, Tuple, Any, Mapping, Optional
+from typing import List, Tuple, Any, Mapping, Optional, Set
 from itertools import chain
+from collections import defaultdict
 from dataclasses import dataclass
+from ctypes import cast, c_void_p
+from os.path import abspath
+from sys import intern
 
 from clang.cindex import (
     CursorKind,
     TypeKind,
     AccessSpecifier,
     Cursor,
+    File,
+    TranslationUnit,
     Type,
     PrintingPolicy,
 )
 from path import Path
 
 from .type_parser import parse_type
-from .translation_unit import parse_tu
-from .utils import current_platform
+from .translation_unit import parse_tu, parse_umbrella_tu
+from .utils import current_platform, object_digest
 
 EXCLUDE_NS: List[str] = []
 
 
+def _intern(s: Optional[str]) -> Optional[str]:
+    """Intern strings repeated across many info objects (None is passed through)
+    """
+
+    return s if s is None else intern(s)
+
+
 def paths_approximately_equal(p1: str, p2: str):
     """Approximate path equality. This is due to
     """
     return any([Path(p1).name.split(".")[0] == Path(p).name.split(".")[0] for p in p2])
 
 
+def is_local(tu, f: File):
+    """Check if the file is approximately equal to the TU path. Memoized per file
+    handle, libclang returns the same handles for all cursors of a TU.
+    """
+
+    if not hasattr(tu, "local_files"):
+        tu.local_files = {}
+
+    key = cast(f._as_parameter_, c_void_p).value
+
+    rv = tu.local_files.get(key)
+    if rv is None:
+        rv = tu.local_files[key] = paths_approximately_equal(Path(f.name), tu.path)
+
+    return rv
+
+
 def is_public(el):
 
     return (el.acess_specifier == AccessSpecifier.PUBLIC) or (
@@ -32,6 +62,112 @@ def is_public(el):
     )
 
 
+class SymbolIndex(object):
+    """Cursors of a translation unit bucketed by kind in a single traversal
+    """
+
+    local: Mapping[CursorKind, List[Cursor]]
+    top_level: Mapping[CursorKind, List[Cursor]]
+    top_level_local: List[Cursor]
+
+    def __init__(self, tu, search_in, exclude_ns):
+
+        self.local = defaultdict(list)
+        self.top_level = defaultdict(list)
+        self.top_level_local = []
+
+        def _index(cursor):
+
+            for child in cursor.get_children():
+                if not is_local(tu, child.location.file):
+                    continue
+
+                if child.access_specifier in (
+                    AccessSpecifier.PUBLIC,
+                    AccessSpecifier.INVALID,
+                ):
+                    self.local[child.kind].append(child)
+
+                if child.kind in search_in and child.spelling not in exclude_ns:
+                    _index(child)
+
+        for child, f in get_top_level(tu):
+            self.top_level[child.kind].append(child)
+
+            if not is_local(tu, f):
+                continue
+
+            self.top_level_local.append(child)
+            self.local[child.kind].append(child)
+
+            if child.kind in search_in and child.spelling not in exclude_ns:
+                _index(child)
+
+
+def get_top_level(tu):
+    """Get the (cached) top level cursors of a translation unit and their files
+    """
+
+    if not hasattr(tu, "top_level"):
+        tu.top_level = [
+            (child, child.location.file) for child in tu.cursor.get_children()
+        ]
+
+    return tu.top_level
+
+
+class HeaderView(object):
+    """Part of an umbrella translation unit visible when parsing a single header
+
+    Visibility is decided using absolute file names, since files loaded from
+    a precompiled header are reported with absolute names.
+    """
+
+    tu: TranslationUnit
+    path: Tuple[str, str]
+    files: Set[str]
+    top_level: List[Tuple[Cursor, File]]
+
+    def __init__(self, tu, path, files, top_level):
+
+        self.tu = tu
+        self.path = ("dummy.cxx", path.name)
+        self.files = files
+        self.top_level = [(child, f) for child, f, name in top_level if name in files]
+
+    @property
+    def cursor(self):
+
+        return self.tu.cursor
+
+
+def get_definition(tu, cur):
+    """Definition of the cursor if it would be part of the TU parsed standalone
+    """
+
+    rv = cur.get_definition()
+    files = getattr(tu, "files", None)
+
+    if rv is None or files is None or abspath(rv.location.file.name) in files:
+        return rv
+
+
+def get_symbol_index(
+    tu, search_in=(CursorKind.NAMESPACE,), exclude_ns: List[str] = []
+):
+    """Get the (cached) symbol index of a translation unit
+    """
+
+    if not hasattr(tu, "symbol_index"):
+        tu.symbol_index = {}
+
+    key = (tuple(search_in), tuple(exclude_ns))
+    if key not in tu.symbol_index:
+        tu.symbol_index[key] = SymbolIndex(tu, search_in, exclude_ns)
+
+    return tu.symbol_index[key]
+
+
 def get_symbols(
     tu,
     kind,
@@ -44,75 +180,42 @@ def get_symbols(
     Search_in allows to explore nested entities as well.
 
     """
-    tu_path = tu.path
-
-    def _get_symbols(cursor, kind):
-
-        for child in cursor.get_children():
-            if (
-                paths_approximately_equal(
-                    Path(child.location.file.name), tu_path)
-                and child.kind == kind
-            ):
-                if ignore_forwards:
-                    if child.get_definition() is None:
-                        pass  # forward declaration
-                    elif not paths_approximately_equal(
-                        Path(child.get_definition().location.file.name), tu_path
-                    ):
-                        pass  # forward declaration but declared in an include
-                    else:
-                        yield child  # legitimate
-                else:
-                    yield child
-            if (
-                paths_approximately_equal(
-                    Path(child.location.file.name), tu_path)
-                and child.kind in search_in
-                and child.spelling not in exclude_ns
-            ):
-                for nested in _get_symbols(child, kind):
-                    if nested.access_specifier in (
-                        AccessSpecifier.PUBLIC,
-                        AccessSpecifier.INVALID,
-                    ):
-                        yield nested
-
-    yield from _get_symbols(tu.cursor, kind)
+    for child in get_symbol_index(tu, search_in, exclude_ns).local[kind]:
+        if ignore_forwards:
+            definition = get_definition(tu, child)
+            if definition is None:
+                pass  # forward declaration
+            elif not is_local(tu, definition.location.file):
+                pass  # forward declaration but declared in an include
+            else:
+                yield child  # legitimate
+        else:
+            yield child
 
 
 def get_forward_declarations(tu):
     """Get all symbols that are forward declared"""
-    tu_path = tu.path
 
-    for child in tu.cursor.get_children():
-        if paths_approximately_equal(Path(child.location.file.name), tu_path):
-            if child.get_definition() is None:
-                yield child
+    for child in get_symbol_index(tu).top_level_local:
+        if get_definition(tu, child) is None:
+            yield child
 
 
 def get_all_symbols(tu, kind):
     """All defined symbols of given kind
     """
-    tu_path = tu.path
 
-    for child in tu.cursor.get_children():
-        if (
-            paths_approximately_equal(Path(child.location.file.name), tu_path)
-            and child.kind is kind
-        ):
+    for child in get_symbol_index(tu).top_level_local:
+        if child.kind is kind:
             yield child
 
 
 def get_all_symbols_multi(tu, kinds):
     """All defined symbols of given kinds
     """
-    tu_path = tu.path
 
-    for child in tu.cursor.get_children():
-        if paths_approximately_equal(Path(child.location.file.name), tu_path) and any(
-            (child.kind is kind for kind in kinds)
-        ):
+    for child in get_symbol_index(tu).top_level_local:
+        if any((child.kind is kind for kind in kinds)):
             yield child
 
 
@@ -209,12 +312,50 @@ def get_namespaces(tu, ignore_ns=[]):
             yield el
 
 
+class ChildrenIndex(object):
+    """Children of a cursor bucketed by kind and access specifier
+    """
+
+    children: List[Cursor]
+    kind: Mapping[CursorKind, List[Cursor]]
+    kind_access: Optional[Mapping[Tuple[CursorKind, AccessSpecifier], List[Cursor]]]
+
+    def __init__(self, cur: Cursor):
+
+        self.children = list(cur.get_children())
+        self.kind = defaultdict(list)
+        self.kind_access = None
+
+        for child in self.children:
+            self.kind[child.kind].append(child)
+
+    def get(self, kind, access):
+
+        # access specifiers are only needed for classes being processed
+        if self.kind_access is None:
+            self.kind_access = defaultdict(list)
+            for child in self.children:
+                self.kind_access[child.kind, child.access_specifier].append(child)
+
+        return self.kind_access[kind, access]
+
+
+def get_children_index(cur: Cursor):
+    """Get the (cached) children index of a cursor
+    """
+
+    if not hasattr(cur, "children_index"):
+        cur.children_index = ChildrenIndex(cur)
+
+    return cur.children_index
+
+
 def get_x(cls, kind):
     """Get children entities of the specified type excluding forward declataions
     """
 
-    for child in cls.get_children():
-        if child.kind is kind and child.get_definition():
+    for child in get_children_index(cls).kind[kind]:
+        if child.get_definition():
             yield child
 
 
@@ -222,7 +363,7 @@ def get_x_multi(cls, kinds):
     """Get children entities of the specified types excluding forward declataions
     """
 
-    for child in cls.get_children():
+    for child in get_children_index(cls).children:
         if any((child.kind is kind for kind in kinds)) and child.get_definition():
             yield child
 
@@ -231,9 +372,7 @@ def get_xx(cls, kind, access):
     """Get children entities of the specified type with given access specifier
     """
 
-    for child in cls.get_children():
-        if child.kind is kind and child.access_specifier is access:
-            yield child
+    yield from get_children_index(cls).get(kind, access)
 
 
 def get_template_type_params(cls):
@@ -287,12 +426,18 @@ def get_inheritance_relations(tu):
     """Inheritance relations pairs
     """
 
-    all_classes = get_x(tu.cursor, CursorKind.CLASS_DECL)
+    index = get_symbol_index(tu)
+
+    all_classes = (
+        c for c in index.top_level[CursorKind.CLASS_DECL] if get_definition(tu, c)
+    )
 
     for c in all_classes:
         yield c.spelling, get_base_class((c))
 
-    all_templates = get_x(tu.cursor, CursorKind.CLASS_TEMPLATE)
+    all_templates = (
+        c for c in index.top_level[CursorKind.CLASS_TEMPLATE] if get_definition(tu, c)
+    )
 
     for c in all_templates:
         yield c.spelling, get_base_class((c))
@@ -467,23 +612,56 @@ def get_named_type(T: Type) -> Type:
     return rv
 
 
-class BaseInfo(object):
+class SlotsMixin(object):
+    """Compact storage of the info objects
+
+    Attributes are __slots__ and pickled as a tuple of their values, unset
+    attributes are marked with Ellipsis and stay unset when unpickled.
+    """
+
+    __slots__ = ()
+
+    _fields: Tuple[str, ...] = ()
+
+    def __init_subclass__(cls, **kwargs):
+
+        super().__init_subclass__(**kwargs)
+        cls._fields = tuple(
+            name for c in reversed(cls.__mro__) for name in c.__dict__.get("__slots__", ())
+        )
+
+    def __getstate__(self):
+
+        return tuple(getattr(self, name, ...) for name in self._fields)
+
+    def __setstate__(self, state):
+
+        for name, value in zip(self._fields, state):
+            if value is not ...:
+                setattr(self, name, value)
+
+
+class BaseInfo(SlotsMixin):
     """Base class for the info objects
     """
 
+    __slots__ = ("name", "comment")
+
     name: str
     comment: str
 
     def __init__(self, cur: Cursor):
 
-        self.name = cur.spelling
-        self.comment = cur.brief_comment
+        self.name = _intern(cur.spelling)
+        self.comment = _intern(cur.brief_comment)
 
 
 class FieldInfo(BaseInfo):
     """Container for field parsing reults
     """
 
+    __slots__ = ("type", "const", "pod")
+
     type: str
     const: bool
     pod: bool
@@ -492,7 +670,7 @@ class FieldInfo(BaseInfo):
 
         super(FieldInfo, self).__init__(cur)
 
-        self.type = cur.type.spelling
+        self.type = _intern(cur.type.spelling)
         self.const = cur.type.is_const_qualified()
         self.pod = cur.type.is_pod()
 
@@ -501,6 +679,8 @@ class EnumInfo(BaseInfo):
     """Container for enum parsing results
     """
 
+    __slots__ = ("values", "anonymous")
+
     comment: str
     values: List[str]
     anonymous: bool
@@ -509,29 +689,40 @@ class EnumInfo(BaseInfo):
 
         super(EnumInfo, self).__init__(cur)
 
-        self.comment = cur.brief_comment
-        self.values = [el.spelling for el in get_enum_values(cur)]
+        self.values = [_intern(el.spelling) for el in get_enum_values(cur)]
         self.anonymous = False
-        self.name = cur.type.spelling
+        self.name = _intern(cur.type.spelling)
 
         if any(x in self.name for x in ["anonymous", "unnamed"]):
             self.anonymous = True
-            self.name = "::".join(self.name.split(
-                "::")[:-1])  # get rid of anonymous
+            self.name = _intern(
+                "::".join(self.name.split("::")[:-1])
+            )  # get rid of anonymous
 
 
 class FunctionInfo(BaseInfo):
     """Container for function parsing results
     """
 
+    __slots__ = (
+        "namespace",
+        "full_name",
+        "mangled_name",
+        "return_type",
+        "inline",
+        "pointer_by_ref",
+        "args",
+        "default_value_types",
+    )
+
     namespace: Optional[str]
     full_name: str
     mangled_name: str
     return_type: str
     inline: bool
     pointer_by_ref: bool
-    args: List[Tuple[str, str, str]]
-    default_value_types: List[str]
+    args: Tuple[Tuple[str, str, Optional[str]], ...]
+    default_value_types: Tuple[str, ...]
 
     KIND_DICT = {
         TypeKind.LVALUEREFERENCE: " &",
@@ -543,31 +734,32 @@ class FunctionInfo(BaseInfo):
 
         super(FunctionInfo, self).__init__(cur)
 
-        self.comment = cur.brief_comment
         self.full_name = cur.displayname
         self.mangled_name = cur.mangled_name
         self.return_type = self._underlying_type(cur.result_type, cur)
 
         if cur.semantic_parent.kind == CursorKind.NAMESPACE:
-            self.namespace = cur.semantic_parent.spelling
+            self.namespace = _intern(cur.semantic_parent.spelling)
         else:
             self.namespace = None
 
         self.inline = (
             cur.get_definition().is_inline() if cur.get_definition() else False
         )
-        self.pointer_by_ref = any(
-            self._pointer_by_ref(el) for el in cur.get_arguments()
+
+        args = list(cur.get_arguments())
+        defaults = [self._default_value(el) for el in args]
+
+        self.pointer_by_ref = any(self._pointer_by_ref(el) for el in args)
+        self.args = tuple(
+            (_intern(el.spelling), self._underlying_type(el, cur), _intern(default))
+            for el, default in zip(args, defaults)
         )
-        self.args = [
-            (el.spelling, self._underlying_type(el, cur), self._default_value(el))
-            for el in cur.get_arguments()
-        ]
-        self.default_value_types = [
+        self.default_value_types = tuple(
             self._underlying_type(el, cur, False)
-            for el in cur.get_arguments()
-            if self._default_value(el)
-        ]
+            for el, default in zip(args, defaults)
+            if default
+        )
 
     def _pointer_by_ref(self, cur: Cursor) -> bool:
         """Check is type is a Pointer passed by reference
@@ -589,13 +781,34 @@ class FunctionInfo(BaseInfo):
         self, cur: Cursor | Type, ctx: Cursor, add_qualifiers=True
     ) -> str:
         """Tries to resolve the underlying type. Needed for typedefed templates.
+
+        Results are memoized per TU on the identity of the (sugared) clang type.
         """
 
         T = cur.type if isinstance(cur, Cursor) else cur
+        tu = ctx.translation_unit
 
-        ptr = self.KIND_DICT.get(T.kind, "")
+        if not hasattr(tu, "type_cache"):
+            tu.type_cache = {}
+            tu.printing_policy = PrintingPolicy.create(ctx)
 
-        policy = PrintingPolicy.create(ctx)
+        key = (T._kind_id, T.data[0], add_qualifiers)
+
+        rv = tu.type_cache.get(key)
+        if rv is None:
+            rv = tu.type_cache[key] = _intern(
+                self._resolve_type(T, ctx, tu.printing_policy, add_qualifiers)
+            )
+
+        return rv
+
+    def _resolve_type(
+        self, T: Type, ctx: Cursor, policy: PrintingPolicy, add_qualifiers
+    ) -> str:
+        """Uncached implementation of _underlying_type
+        """
+
+        ptr = self.KIND_DICT.get(T.kind, "")
 
         # if lvaule,rvalue or pointer type
         if ptr:
@@ -664,6 +877,11 @@ class FunctionInfo(BaseInfo):
         """
 
         rv = None
+
+        # only arguments with an initializer expression need to be tokenized
+        if not any(ch.kind.is_expression() for ch in cur.get_children()):
+            return rv
+
         tokens = [t.spelling for t in cur.get_tokens()]
         if "=" in tokens:
             rv = " ".join(tokens[tokens.index("=") + 1:])
@@ -679,6 +897,8 @@ class MethodInfo(FunctionInfo):
     """Container for method parsing results
     """
 
+    __slots__ = ("const", "virtual", "pure_virtual")
+
     const: bool
     virtual: bool
     pure_virtual: bool
@@ -696,20 +916,57 @@ class ConstructorInfo(MethodInfo):
     """Container for constructor parsing results
     """
 
-    pass
+    __slots__ = ()
 
 
 class DestructorInfo(FunctionInfo):
     """Container for destructor parsing results
     """
 
-    pass
+    __slots__ = ()
 
 
-class ClassInfo(object):
+class ClassInfo(SlotsMixin):
     """Container for class parsing results
+
+    The *_unfiltered tuples hold the members before undefined symbols were
+    removed (see remove_undefined_mangled).
     """
 
+    __slots__ = (
+        "name",
+        "comment",
+        "abstract",
+        "constructors",
+        "nonpublic_constructors",
+        "fields",
+        "enums",
+        "methods",
+        "protected_virtual_methods",
+        "private_virtual_methods",
+        "static_methods",
+        "static_methods_byref",
+        "methods_byref",
+        "methods_return_byref",
+        "operators",
+        "static_operators",
+        "destructors",
+        "nonpublic_destructors",
+        "ptr",
+        "superclass",
+        "rootclass",
+        "superclasses",
+        "methods_dict",
+        "protected_virtual_methods_dict",
+        "private_virtual_methods_dict",
+        "methods_unfiltered",
+        "methods_byref_unfiltered",
+        "methods_return_byref_unfiltered",
+        "static_methods_unfiltered",
+        "static_methods_byref_unfiltered",
+        "constructors_unfiltered",
+    )
+
     name: str
     comment: str
     abstract: bool
@@ -745,10 +1002,17 @@ class ClassInfo(object):
     protected_virtual_methods_dict: Mapping[str, MethodInfo]
     private_virtual_methods_dict: Mapping[str, MethodInfo]
 
+    methods_unfiltered: Tuple[MethodInfo, ...]
+    methods_byref_unfiltered: Tuple[MethodInfo, ...]
+    methods_return_byref_unfiltered: Tuple[MethodInfo, ...]
+    static_methods_unfiltered: Tuple[MethodInfo, ...]
+    static_methods_byref_unfiltered: Tuple[MethodInfo, ...]
+    constructors_unfiltered: Tuple[ConstructorInfo, ...]
+
     def __init__(self, cur: Cursor):
 
-        self.name = cur.type.spelling
-        self.comment = cur.brief_comment
+        self.name = _intern(cur.type.spelling)
+        self.comment = _intern(cur.brief_comment)
         self.abstract = cur.is_abstract_record()
 
         self.constructors = self.filter_rvalues(
@@ -843,16 +1107,18 @@ class ClassInfo(object):
 
 class ClassTemplateInfo(ClassInfo):
 
+    __slots__ = ("type_params",)
+
     type_params: List[Tuple[Optional[str], str, str]]
 
     def __init__(self, cur: Cursor):
         super(ClassTemplateInfo, self).__init__(cur)
-        self.name = cur.spelling
+        self.name = _intern(cur.spelling)
         self.type_params = [
             (
-                None if el.spelling == el.type.spelling else el.type.spelling,
-                el.spelling,
-                default,
+                None if el.spelling == el.type.spelling else _intern(el.type.spelling),
+                _intern(el.spelling),
+                _intern(default),
             )
             for el, default in get_template_type_params(cur)
         ]
@@ -860,6 +1126,8 @@ class ClassTemplateInfo(ClassInfo):
 
 class TypedefInfo(BaseInfo):
 
+    __slots__ = ("type", "pod", "template_base", "template_args")
+
     type: str
     pod: bool
     template_base: List[str]
@@ -871,17 +1139,17 @@ class TypedefInfo(BaseInfo):
 
         t = cur.underlying_typedef_type
 
-        self.type = t.spelling
+        self.type = _intern(t.spelling)
         self.pod = t.is_pod()
 
         if not self.pod:
             self.template_base = [
-                ch.spelling
+                _intern(ch.spelling)
                 for ch in cur.get_children()
                 if ch.kind == CursorKind.TEMPLATE_REF
             ]
             self.template_args = [
-                ch.spelling
+                _intern(ch.spelling)
                 for ch in cur.get_children()
                 if ch.kind == CursorKind.TYPE_REF
             ]
@@ -889,7 +1157,18 @@ class TypedefInfo(BaseInfo):
 
 class ForwardInfo(BaseInfo):
 
-    pass
+    __slots__ = ()
+
+    def __init__(self, cur: Cursor, tu=None):
+
+        super(ForwardInfo, self).__init__(cur)
+
+        # comment of a definition not visible in a header view
+        files = getattr(tu, "files", None)
+        f = cur.get_comment_extent().start.file if files else None
+
+        if f and abspath(f.name) not in files:
+            self.comment = ""
 
 
 class HeaderInfo(object):
@@ -910,6 +1189,7 @@ class HeaderInfo(object):
     typedef_dict: Mapping[str, str]
     forwards: List[ForwardInfo]
     namespaces: List[str]
+    digest: str
 
     def __init__(self):
 
@@ -949,35 +1229,35 @@ class HeaderInfo(object):
 
         _resolve_inheritance(cls.superclass)
 
-    def parse(self, path, input_folder, settings, module_name):
-
-        module_settings = settings["Modules"].get(module_name)
-
-        if module_settings:
-            tu_parsing_header = "\n".join(
-                (
-                    module_settings["module_parsing_header"],
-                    module_settings["parsing_headers"].get(path.name, ""),
-                )
-            )
-        else:
-            tu_parsing_header = ""
+    def parse(
+        self, path, input_folder, settings, module_name, pch_folder=None, ast_folder=None
+    ):
 
         tr_unit = parse_tu(
             path,
             input_folder,
-            prefix=settings[current_platform()]["prefix"],
-            platform_includes=settings[current_platform()]["includes"],
-            parsing_header=settings["parsing_header"],
-            tu_parsing_header=tu_parsing_header,
-            platform_parsing_header=settings[current_platform(
-            )]["parsing_header"],
+            pch_folder=pch_folder,
+            ast_folder=ast_folder,
+            **get_tu_options(path, settings, module_name),
+        )
+
+        self.extract(
+            path,
+            tr_unit,
+            [src for src, _ in tr_unit.pch_inclusions]
+            + [src for src, _ in tr_unit.inclusions],
         )
 
+        # break the reference cycle between the TU and its cursors
+        del tr_unit.top_level
+
+        return tr_unit
+
+    def extract(self, path, tr_unit, dependencies):
+
         self.name = path
         self.short_name = path.splitpath()[-1]
-        self.dependencies = [
-            el.location.file.name for el in tr_unit.get_includes()]
+        self.dependencies = [intern(d) for d in dependencies]
         self.enums = [EnumInfo(el) for el in get_enums(tr_unit)]
         self.functions = [FunctionInfo(el) for el in get_functions(tr_unit)]
         self.operators = [FunctionInfo(el) for el in get_operators(tr_unit)]
@@ -1000,10 +1280,11 @@ class HeaderInfo(object):
                             v in get_inheritance_relations(tr_unit) if v}
         self.typedefs = [TypedefInfo(el) for el in get_typedefs(tr_unit)]
         self.typedef_dict = {t.name: self.name for t in self.typedefs}
-        self.forwards = [ForwardInfo(el)
-                         for el in get_forward_declarations(tr_unit)]
+        self.forwards = [
+            ForwardInfo(el, tr_unit) for el in get_forward_declarations(tr_unit)
+        ]
 
-        self.namespaces = [el.spelling for el in get_namespaces(tr_unit)]
+        self.namespaces = [_intern(el.spelling) for el in get_namespaces(tr_unit)]
 
         # handle freely defined methods
         methods = [el for el in get_free_method_definitions(tr_unit)]
@@ -1021,21 +1302,156 @@ class HeaderInfo(object):
         for c in self.class_templates.values():
             self.resolve_inheritance(c)
 
-        return tr_unit
+        # break the reference cycle between the (view of the) TU and its cursors
+        del tr_unit.symbol_index
+
+        # identifies the parsing result, e.g. for caching transformed modules
+        self.digest = object_digest(vars(self))
 
 
-def process_header(path, input_folder, settings, module_name=None):
+def get_tu_options(path, settings, module_name=None):
+    """Collect the platform and module specific options used to parse a header
+
+    If path is None only the options common to the whole module are returned.
+    """
+
+    module_settings = settings["Modules"].get(module_name)
+
+    if module_settings:
+        tu_parsing_header = "\n".join(
+            (
+                module_settings["module_parsing_header"],
+                module_settings["parsing_headers"].get(path.name, "")
+                if path
+                else "",
+            )
+        )
+    else:
+        tu_parsing_header = ""
+
+    return dict(
+        prefix=settings[current_platform()]["prefix"],
+        platform_includes=settings[current_platform()]["includes"],
+        parsing_header=settings["parsing_header"],
+        tu_parsing_header=tu_parsing_header,
+        platform_parsing_header=settings[current_platform()]["parsing_header"],
+    )
+
+
+def process_header(path, input_folder, settings, module_name=None, cache=None):
     """Main function from this module
     """
 
+    if cache:
+        key = cache.key(path, input_folder, settings, module_name)
+        hi = cache.load(key)
+
+        if hi:
+            return hi
+
     hi = HeaderInfo()
-    hi.parse(path, input_folder, settings, module_name)
+    tr_unit = hi.parse(
+        path,
+        input_folder,
+        settings,
+        module_name,
+        cache.pch if cache else None,
+        cache.ast if cache else None,
+    )
+
+    if cache:
+        cache.store(key, hi, tr_unit)
 
     return hi
 
 
+def get_closure(graph, roots):
+    """Transitive closure of roots in the include graph
+    """
+
+    rv = set(roots)
+    stack = list(roots)
+
+    while stack:
+        for inc in graph[stack.pop()]:
+            if inc not in rv:
+                rv.add(inc)
+                stack.append(inc)
+
+    return rv
+
+
+def process_headers(paths, input_folder, settings, module_name, cache=None):
+    """Process all headers of a module using a single umbrella TU
+
+    Headers with their own parsing headers are not supported.
+    """
+
+    if cache:
+        key = cache.key(paths, input_folder, settings, module_name)
+        rv = cache.load(key)
+
+        if rv:
+            return rv
+
+    tr_unit = parse_umbrella_tu(
+        paths,
+        input_folder,
+        pch_folder=cache.pch if cache else None,
+        ast_folder=cache.ast if cache else None,
+        **get_tu_options(None, settings, module_name),
+    )
+
+    # split the top level cursors into the include graph and declarations
+    graph = defaultdict(list)
+    top_level = []
+
+    for child, f in get_top_level(tr_unit):
+        if child.kind == CursorKind.INCLUSION_DIRECTIVE:
+            inc = child.get_included_file()
+            if inc:
+                graph[abspath(f.name)].append(abspath(inc.name))
+        elif not child.kind.is_preprocessing():
+            top_level.append((child, f, abspath(f.name)))
+
+    # files of the prologue are visible from every header
+    dummy = abspath("dummy.cxx")
+    names = {Path(inc).name: inc for inc in graph[dummy]}
+    headers = {names[p.name] for p in paths if p.name in names}
+
+    prologue = {dummy}
+    for src, inc in tr_unit.pch_inclusions:
+        prologue.update((abspath(src), abspath(inc)))
+
+    prologue_graph = defaultdict(list, graph)
+    prologue_graph[dummy] = [inc for inc in graph[dummy] if inc not in headers]
+    prologue = get_closure(prologue_graph, prologue)
+
+    rv = []
+    for p in paths:
+        files = get_closure(graph, [names[p.name]] if p.name in names else []) | prologue
+
+        hi = HeaderInfo()
+        hi.extract(
+            p,
+            HeaderView(tr_unit, p, files, top_level),
+            [src for src, _ in tr_unit.pch_inclusions]
+            + [src for src in graph if src in files],
+        )
+        rv.append(hi)
+
+    # break the reference cycle between the TU and its cursors
+    del tr_unit.top_level
+
+    if cache:
+        cache.store(key, rv, tr_unit)
+
+    return rv
+
+
 __all__ = [
     process_header,
+    process_headers,
 ]
 
 if __name__ == "__main__":
@@ -0,0 +1,400 @@
+import os
+import json
+import pickle
+
+from functools import lru_cache
+from hashlib import sha256
+from time import perf_counter
+from typing import Any, Dict, List
+
+from path import Path
+from toposort import toposort_flatten
+
+from . import columnar
+from .shards import Shard
+
+# sharded intermediate representation layout:
+#   manifest.json: format version, stage and the sha256 of all other files
+#   index.pkl: cross-module dictionaries and per-module summaries
+#   modules/<name>.pkl|.bgir: one ModuleInfo per module (pickle or columnar)
+FORMAT = 1
+MANIFEST = "manifest.json"
+
+# serializers of the module files by name and by suffix
+SERIALIZERS = {
+    "pickle": (".pkl", lambda obj: pickle.dumps(obj, protocol=pickle.HIGHEST_PROTOCOL)),
+    "columnar": (columnar.SUFFIX, columnar.dumps),
+}
+DESERIALIZERS = {".pkl": pickle.loads, columnar.SUFFIX: columnar.loads}
+
+
+def is_ir(p):
+    """Check if p is a sharded IR folder
+    """
+
+    return (Path(p) / MANIFEST).exists()
+
+
+def summarize(m) -> Dict[str, Any]:
+    """Information about a module needed when processing other modules
+    """
+
+    return dict(
+        digest=getattr(m, "digest", None),
+        classes=[c.name for c in m.classes],
+        enums=[e.name for e in m.enums],
+        typedefs=[t.name for t in m.typedefs],
+        class_templates={t.name: list(t.superclass) for t in m.class_templates},
+        bases=sorted(set(s for c in m.classes + m.class_templates for s in c.superclass)),
+        template_bases=sorted(
+            set(t.template_base[0] for t in m.typedefs if not t.pod and t.template_base)
+        ),
+        dependencies=sorted(set(m.dependencies) | set(m.dependencies_headers)),
+    )
+
+
+def toposort_summaries(summaries: Dict[str, Dict[str, Any]]) -> List[str]:
+    """Module names sorted such that base classes are registered first
+    """
+
+    cls_dict = {c: name for name, s in summaries.items() for c in s["classes"]}
+    tmpl_dict = {
+        t: bases for s in summaries.values() for t, bases in s["class_templates"].items()
+    }
+
+    deps = {}
+    for name, s in summaries.items():
+        bases = set(s["bases"])
+        for t in s["template_bases"]:
+            bases.update(tmpl_dict.get(t, []))
+
+        deps[name] = set(cls_dict[b] for b in bases if b in cls_dict) - {name}
+
+    return toposort_flatten(deps)
+
+
+class ModuleSet(object):
+    """Modules held in memory together with their cross-module lookups
+    """
+
+    def __init__(self, modules):
+
+        self.modules = list(modules)
+
+    @property
+    def names(self):
+
+        return [m.name for m in self.modules]
+
+    @property
+    def summaries(self):
+
+        return {m.name: summarize(m) for m in self.modules}
+
+    @property
+    def classes(self):
+
+        return {c.name: c for m in self.modules for c in m.classes}
+
+    @property
+    def enums(self):
+
+        return {e.name: e for m in self.modules for e in m.enums}
+
+    @property
+    def typedefs(self):
+
+        return {t.name: t for m in self.modules for t in m.typedefs}
+
+    def select(self, names=None):
+        """Iterate over all modules or only over the given ones
+        """
+
+        return (m for m in self.modules if names is None or m.name in names)
+
+    def __iter__(self):
+
+        return iter(self.modules)
+
+    def __len__(self):
+
+        return len(self.modules)
+
+
+class _LazyDict(object):
+    """Read-only mapping of names to objects loaded with their module on demand
+    """
+
+    def __init__(self, ir, owners, attr):
+
+        self.ir = ir
+        self.owners = owners
+        self.attr = attr
+
+    def __contains__(self, name):
+
+        return name in self.owners
+
+    def __getitem__(self, name):
+
+        return self.ir.lookup(self.owners[name], self.attr)[name]
+
+    def get(self, name, default=None):
+
+        return self[name] if name in self.owners else default
+
+
+class IR(ModuleSet):
+    """Sharded IR folder; modules are loaded one at a time when iterated
+
+    Objects of other modules are loaded on demand and a few modules are
+    kept in memory, so that memory use does not grow with the number of
+    modules.
+    """
+
+    path: Path
+    manifest: Dict[str, Any]
+    index: Dict[str, Any]
+
+    def __init__(self, path, cache_size=8, stage=None):
+
+        self.path = Path(path)
+
+        with open(self.path / MANIFEST) as f:
+            self.manifest = json.load(f)
+
+        if self.manifest.get("format") != FORMAT:
+            raise ValueError(f"{path} is not a supported IR folder")
+
+        if stage and self.manifest["stage"] != stage:
+            raise ValueError(
+                f"{path} holds {self.manifest['stage']} modules, expected {stage} ones"
+            )
+
+        self.files = {el["name"]: el for el in self.manifest["modules"]}
+        self.index = pickle.loads(self._read(self.manifest["index"]))
+
+        self.module = lru_cache(cache_size)(self._load)
+        self.lookup = lru_cache(cache_size)(self._lookup)
+
+    def _read(self, entry):
+
+        with open(self.path / entry["file"], "rb") as f:
+            data = f.read()
+
+        if sha256(data).hexdigest() != entry["sha256"]:
+            raise ValueError(f"{self.path / entry['file']} does not match the manifest")
+
+        return data
+
+    def _load(self, name):
+
+        entry = self.files[name]
+
+        return DESERIALIZERS[Path(entry["file"]).suffix](self._read(entry))
+
+    def _lookup(self, name, attr):
+
+        entry = self.files[name]
+
+        # columnar files stay mapped and only the requested objects are decoded
+        if Path(entry["file"]).suffix == columnar.SUFFIX:
+            reader = columnar.open_reader(self.path / entry["file"], entry["sha256"])
+
+            return reader.index(reader.field_id(reader.root, attr))
+
+        return {el.name: el for el in getattr(self.module(name), attr)}
+
+    def _owners(self, key):
+
+        return {el: name for name, s in self.summaries.items() for el in s[key]}
+
+    @property
+    def stage(self):
+
+        return self.manifest["stage"]
+
+    @property
+    def names(self):
+
+        return list(self.files)
+
+    @property
+    def summaries(self):
+
+        return self.index["summaries"]
+
+    @property
+    def classes(self):
+
+        return _LazyDict(self, self._owners("classes"), "classes")
+
+    @property
+    def enums(self):
+
+        return _LazyDict(self, self._owners("enums"), "enums")
+
+    @property
+    def typedefs(self):
+
+        return _LazyDict(self, self._owners("typedefs"), "typedefs")
+
+    def __getitem__(self, key):
+        """Cross-module dictionaries stored with the modules
+        """
+
+        return self.index[key]
+
+    def shards(self):
+        """Handles of the module files, e.g. for worker processes
+
+        The handles carry the sha256 of the manifest, so workers validate the
+        files like module() does.
+        """
+
+        return [
+            Shard(self.path / el["file"], digest=el["sha256"])
+            for el in self.files.values()
+        ]
+
+    def select(self, names=None):
+
+        return (self.module(n) for n in self.files if names is None or n in names)
+
+    def __iter__(self):
+
+        return self.select()
+
+    def __len__(self):
+
+        return len(self.files)
+
+
+class IRWriter(object):
+    """Write modules one by one to a sharded IR folder
+
+    The manifest is written last, so an interrupted run never leaves a
+    folder that looks complete.
+    """
+
+    path: Path
+    stage: str
+    format: str
+
+    def __init__(self, path, stage, format="pickle"):
+
+        self.path = Path(path)
+        self.stage = stage
+        self.format = format
+        self.modules = []
+        self.summaries = {}
+
+        (self.path / MANIFEST).remove_p()
+        (self.path / "modules").rmtree_p()
+        (self.path / "modules").makedirs_p()
+
+    def _write(self, name, obj, format="pickle"):
+
+        suffix, dumps = SERIALIZERS[format]
+        name += suffix
+        data = dumps(obj)
+
+        with open(self.path / name, "wb") as f:
+            f.write(data)
+
+        return dict(file=name, sha256=sha256(data).hexdigest())
+
+    def add(self, m):
+
+        self.modules.append(
+            dict(name=m.name, **self._write(f"modules/{m.name}", m, self.format))
+        )
+        self.summaries[m.name] = summarize(m)
+
+    def close(self, **index):
+        """Store the cross-module dictionaries and the manifest
+        """
+
+        manifest = dict(
+            format=FORMAT,
+            stage=self.stage,
+            index=self._write("index", dict(index, summaries=self.summaries)),
+            modules=self.modules,
+        )
+
+        tmp = self.path / f"{MANIFEST}.tmp.{os.getpid()}"
+
+        with open(tmp, "w") as f:
+            json.dump(manifest, f, indent=1)
+
+        os.replace(tmp, self.path / MANIFEST)
+
+
+def write_ir(path, stage, modules, format="pickle", **index):
+    """Write an iterable of modules to a sharded IR folder
+    """
+
+    writer = IRWriter(path, stage, format)
+
+    for m in modules:
+        writer.add(m)
+
+    writer.close(**index)
+
+
+def _pickle_lookup(data, attr, name):
+
+    return {el.name: el for el in getattr(pickle.loads(data), attr)}[name]
+
+
+def _columnar_lookup(data, attr, name):
+
+    reader = columnar.Reader(data)
+
+    return reader.index(reader.field_id(reader.root, attr))[name]
+
+
+# single object of a module, as IR.lookup gets it for other modules
+LOOKUPS = {".pkl": _pickle_lookup, columnar.SUFFIX: _columnar_lookup}
+
+
+def benchmark(modules, repeat=3) -> List[Dict[str, Any]]:
+    """Size, best dump/load times of the modules and best time to look up the
+    last class of every module for all serializers
+    """
+
+    modules = list(modules)
+    rv = []
+
+    for name, (suffix, dumps) in SERIALIZERS.items():
+        loads = DESERIALIZERS[suffix]
+        lookup = LOOKUPS[suffix]
+        dump_time = load_time = lookup_time = float("inf")
+
+        shards = [(dumps(m), m.classes[-1].name) for m in modules if m.classes]
+
+        for _ in range(repeat):
+            t0 = perf_counter()
+            data = dumps(modules)
+            t1 = perf_counter()
+            loads(data)
+            t2 = perf_counter()
+            for el, cls in shards:
+                lookup(el, "classes", cls)
+            t3 = perf_counter()
+
+            dump_time = min(dump_time, t1 - t0)
+            load_time = min(load_time, t2 - t1)
+            lookup_time = min(lookup_time, t3 - t2)
+
+        rv.append(
+            dict(
+                format=name,
+                size=len(data),
+                dump=dump_time,
+                load=load_time,
+                lookup=lookup_time,
+            )
+        )
+
+    return rv
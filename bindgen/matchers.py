@@ -0,0 +1,111 @@
+import re
+
+from bisect import bisect_left
+from collections import defaultdict
+from functools import lru_cache
+from typing import Callable, Dict, Iterable, List, Tuple
+
+# characters that make a pattern more than a literal prefix
+SPECIAL = frozenset(".^$*+?{}[]\\|()")
+
+
+def _never(name):
+
+    return None
+
+
+@lru_cache(maxsize=None)
+def compile_matcher(patterns: Tuple[str, ...], template: bool = False) -> Callable:
+    """Single matcher equivalent to any(re.match(pat, name) for pat in patterns)
+
+    With template=True the patterns match class template instantiations,
+    i.e. name is matched against f"^{pat}<.*>". Compiled matchers are cached
+    per tuple of patterns, so every platform and module compiles them once.
+    """
+
+    if not patterns:
+        return _never
+
+    single = "^{}<.*>" if template else "{}"
+    compiled = [re.compile(single.format(p)) for p in patterns]
+
+    # joining shifts the group numbers, so patterns with groups (and thus
+    # possibly backreferences) are matched on their own
+    matchers = [c.match for c in compiled if c.groups]
+    joined = [p for p, c in zip(patterns, compiled) if not c.groups]
+
+    if joined:
+        try:
+            fmt = f"(?:{single})"
+            combined = re.compile("|".join(fmt.format(p) for p in joined))
+            matchers.insert(0, combined.match)
+        except re.error:
+            # e.g. global inline flags - match one by one
+            matchers[:0] = [c.match for c in compiled if not c.groups]
+
+    if len(matchers) == 1:
+        return matchers[0]
+
+    return lambda name: any(m(name) for m in matchers)
+
+
+def is_literal(pat: str) -> bool:
+
+    return not SPECIAL.intersection(pat)
+
+
+class NameIndex(object):
+    """Objects indexed by their name for re.match style lookups
+
+    Literal patterns (optionally anchored with $) are resolved by bisecting
+    the sorted names, other patterns fall back to a linear scan.
+    """
+
+    names: List[str]
+    objects: Dict[str, List]
+
+    def __init__(self, objects: Iterable):
+
+        self.objects = defaultdict(list)
+
+        for obj in objects:
+            self.objects[obj.name].append(obj)
+
+        self.names = sorted(self.objects)
+
+    def find(self, pat: str) -> List:
+        """Objects whose name matches pat
+        """
+
+        if is_literal(pat):
+            i = bisect_left(self.names, pat)
+            names = []
+
+            while i < len(self.names) and self.names[i].startswith(pat):
+                names.append(self.names[i])
+                i += 1
+
+        elif pat.endswith("$") and is_literal(pat[:-1]):
+            names = [pat[:-1]] if pat[:-1] in self.objects else []
+
+        else:
+            m = re.compile(pat).match
+            names = [n for n in self.names if m(n)]
+
+        return [obj for n in names for obj in self.objects[n]]
+
+
+def group_exclusions(classes: Iterable, exclusions: Iterable[str]) -> Dict:
+    """Map objects (by id) to the method patterns of matching Class::method rules
+    """
+
+    index = NameIndex(classes)
+    rv = {}
+
+    for pat in exclusions:
+        cls_pat, m_pat = pat.split("::")
+
+        for c in index.find(cls_pat):
+            rv.setdefault(id(c), (c, []))[1].append(m_pat)
+
+    return rv
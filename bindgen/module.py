@@ -9,6 +9,7 @@ from .header import (
     FunctionInfo,
     EnumInfo,
 )
+from .utils import digest, object_digest
 from logzero import logger
 from toposort import toposort_flatten
 
@@ -39,21 +40,28 @@ class ModuleInfo(object):
 
     namespaces: Set[str]
 
+    digest: str
+
     def get_module_name(self, x):
 
         return Path(x).splitpath()[-1].split(".")[0].split("_")[0]
 
-    def __init__(self, name, prefix, paths, module_names, settings):
+    def __init__(
+        self, name, prefix, paths, module_names, settings, cache=None, headers=None
+    ):
 
         self.prefix = prefix
         self.name = name
         self.headers = []
 
-        logger.debug("Processing headers")
+        if headers is not None:
+            self.headers.extend(headers)
+        else:
+            logger.debug("Processing headers")
 
-        for p in paths:
-            logger.debug(p)
-            self.headers.append(process_header(p, prefix, settings, name))
+            for p in paths:
+                logger.debug(p)
+                self.headers.append(process_header(p, prefix, settings, name, cache))
 
         self.classes = []
         self.class_dict = {}
@@ -93,6 +101,16 @@ class ModuleInfo(object):
 
         self.sort_classes()
 
+        # identifies the parsed module independent of the order of its headers
+        self.digest = digest(
+            self.name,
+            sorted(module_names),
+            sorted(
+                (h.name, getattr(h, "digest", None) or object_digest(h))
+                for h in self.headers
+            ),
+        )
+
     def sort_classes(self):
 
         class_dict = {c.name: c for c in self.classes}
@@ -0,0 +1,448 @@
+import os
+import json
+
+from tempfile import NamedTemporaryFile
+from typing import Any, Callable, Dict, List, Optional, Set
+
+import toml
+
+from path import Path
+
+from . import find_module_files
+from .cache import get_version, get_transform_version
+from .schemas import global_schema, module_schema
+from .templates import sources_digest, template_paths
+from .utils import current_platform, digest, file_digest
+
+# state of the previous run stored in the cache folder
+STATE = "state.json"
+
+PLATFORMS = ("Linux", "Windows", "OSX", "FreeBSD")
+
+# global settings requiring to parse all headers again
+PARSE_SETTINGS = (
+    "input_folder",
+    "pats",
+    "exclude",
+    "exclude_namespaces",
+    "parsing_header",
+    "module_mapping",
+)
+PLATFORM_PARSE_SETTINGS = ("prefix", "includes", "parsing_header")
+
+# global settings requiring to transform all modules again
+TRANSFORM_SETTINGS = ("exceptions", "byref_types", "byref_types_smart_ptr")
+PLATFORM_TRANSFORM_SETTINGS = ("symbols", "exclude_classes")
+
+# sources influencing the rendering results besides the transformation code
+RENDER_SOURCES = ("view.py", "templates.py")
+
+# module settings changing the classes or typedefs other modules refer to
+MODULE_GLOBAL_SETTINGS = ("exclude_classes", "exclude_typedefs")
+
+# module settings only changing the module itself (and its subclasses)
+MODULE_TRANSFORM_SETTINGS = (
+    "exclude_class_templates",
+    "exclude_methods",
+    "exclude_class_template_methods",
+    "exclude_functions",
+)
+
+
+def headers_digests(settings, platform) -> Dict[str, str]:
+    """Digest of the content of the headers of every module
+    """
+
+    platform_settings = settings[platform] or {}
+    names = settings["modules"] + platform_settings.get("modules", [])
+    files = find_module_files(
+        Path(settings["input_folder"]), names, settings["pats"], settings["exclude"]
+    )
+
+    return {
+        m: digest(sorted((p.name, file_digest(p)) for p in paths))
+        for m, paths in files.items()
+    }
+
+
+def snapshot(
+    configuration, platform=None, umbrella=False, prefix=Path("")
+) -> Dict[str, Any]:
+    """Validated settings and other inputs of a run that decide what is redone
+
+    Headers are resolved relative to prefix, templates relative to the
+    current folder like in the generate command.
+    """
+
+    with open(configuration) as f:
+        settings = global_schema.validate(toml.load(f))
+
+    platform = platform if platform else current_platform()
+    symbols = settings[platform]["symbols"] if settings[platform] else None
+
+    with prefix:
+        headers = headers_digests(settings, platform)
+
+    rv = dict(
+        settings=settings,
+        platform=platform,
+        umbrella=umbrella,
+        symbols=file_digest(symbols) if symbols and os.path.exists(symbols) else None,
+        inputs=dict(
+            headers=headers,
+            parse=get_version(),
+            transform=get_transform_version(),
+            render=digest(
+                sources_digest(template_paths(settings)),
+                [file_digest(Path(__file__).dirname() / s) for s in RENDER_SOURCES],
+            ),
+        ),
+    )
+
+    # compare like with like when diffing against the stored state
+    return json.loads(json.dumps(rv))
+
+
+def load_state(root) -> Optional[Dict[str, Any]]:
+
+    p = Path(root) / STATE
+
+    if not p.exists():
+        return None
+
+    with open(p) as f:
+        return json.load(f)
+
+
+def save_state(root, state):
+
+    p = Path(root) / STATE
+    p.dirname().makedirs_p()
+
+    with NamedTemporaryFile("w", dir=p.dirname(), delete=False) as f:
+        json.dump(state, f, indent=1, sort_keys=True)
+
+    os.replace(f.name, p)
+
+
+def module_names(state) -> List[str]:
+
+    settings = state["settings"]
+    platform_settings = settings[state["platform"]] or {}
+
+    return settings["modules"] + platform_settings.get("modules", [])
+
+
+def get_dependents(modules: Set[str], dependencies: Dict[str, List[str]]) -> Set[str]:
+    """Modules that (transitively) depend on the given ones
+    """
+
+    rv = set(modules)
+    n = 0
+
+    while n != len(rv):
+        n = len(rv)
+        rv.update(m for m, deps in dependencies.items() if rv.intersection(deps))
+
+    return rv
+
+
+class Plan(object):
+    """Work needed to bring the results of the previous run up to date
+
+    Headers to reparse are listed per module, None meaning all headers of
+    the module.
+    """
+
+    modules: List[str]
+    reparse: Dict[str, Optional[Set[str]]]
+    retransform: Set[str]
+    rerender: Set[str]
+    reasons: List[str]
+
+    def __init__(self, modules):
+
+        self.modules = modules
+        self.reparse = {}
+        self.retransform = set()
+        self.rerender = set()
+        self.reasons = []
+
+    def parse(self, modules, headers=None):
+
+        modules = list(modules)
+
+        for m in modules:
+            if headers is None or self.reparse.get(m, set()) is None:
+                self.reparse[m] = None
+            else:
+                self.reparse.setdefault(m, set()).update(headers)
+
+        self.transform(modules)
+
+    def transform(self, modules):
+
+        self.retransform.update(modules)
+
+    def render(self, modules):
+
+        self.rerender.update(modules)
+
+    def everything(self, reason):
+
+        self.reasons.append(reason)
+        self.parse(self.modules)
+        self.render(self.modules)
+
+        return self
+
+    @property
+    def render_all(self):
+
+        return self.rerender >= set(self.modules)
+
+    def __bool__(self):
+
+        return bool(self.reparse or self.retransform or self.rerender)
+
+
+def _changed(old, new, keys):
+
+    return [k for k in keys if old.get(k) != new.get(k)]
+
+
+def make_plan(
+    old: Optional[Dict[str, Any]],
+    new: Dict[str, Any],
+    get_dependencies: Callable[[], Dict[str, List[str]]],
+) -> Plan:
+    """Diff the settings of two runs and collect the work to be redone
+
+    get_dependencies is only called if the dependencies between the modules
+    of the previous run are needed.
+    """
+
+    modules = module_names(new)
+    plan = Plan(modules)
+
+    if old is None:
+        return plan.everything("no previous run")
+
+    for k in ("platform", "umbrella"):
+        if old[k] != new[k]:
+            return plan.everything(f"{k} changed")
+
+    # headers, bindgen itself (and libclang) and the templates are not settings
+    old_inputs, new_inputs = old.get("inputs") or {}, new["inputs"]
+
+    if old_inputs.get("parse") != new_inputs["parse"]:
+        return plan.everything("bindgen changed")
+
+    old_headers = old_inputs.get("headers")
+    if old_headers is None:
+        return plan.everything("no digests of the headers")
+
+    # headers of new modules are parsed anyway
+    changed = [
+        m for m, h in new_inputs["headers"].items() if old_headers.get(m, h) != h
+    ]
+    if changed:
+        return plan.everything(f"headers of {', '.join(changed)} changed")
+
+    if old_inputs.get("transform") != new_inputs["transform"]:
+        plan.reasons.append("transformation code changed")
+        plan.transform(modules)
+        plan.render(modules)
+
+    if old_inputs.get("render") != new_inputs["render"]:
+        plan.reasons.append("templates or rendering code changed")
+        plan.render(modules)
+
+    old_settings, new_settings = old["settings"], new["settings"]
+    old_platform = old_settings[old["platform"]] or {}
+    new_platform = new_settings[new["platform"]] or {}
+
+    changed = _changed(old_settings, new_settings, PARSE_SETTINGS) + _changed(
+        old_platform, new_platform, PLATFORM_PARSE_SETTINGS
+    )
+    if changed:
+        return plan.everything(f"{', '.join(changed)} changed")
+
+    # new modules are parsed, module names influence the dependencies of all
+    old_modules = module_names(old)
+    if old_modules != modules:
+        plan.reasons.append("modules changed")
+        plan.parse(m for m in modules if m not in old_modules)
+        plan.transform(modules)
+        plan.render(modules)
+
+    changed = _changed(old_settings, new_settings, TRANSFORM_SETTINGS) + _changed(
+        old_platform, new_platform, PLATFORM_TRANSFORM_SETTINGS
+    )
+    if old["symbols"] != new["symbols"]:
+        changed.append("symbols")
+    if changed:
+        plan.reasons.append(f"{', '.join(changed)} changed")
+        plan.transform(modules)
+        plan.render(modules)
+
+    classified = (
+        set(PARSE_SETTINGS)
+        | set(TRANSFORM_SETTINGS)
+        | set(PLATFORMS)
+        | {"modules", "Modules"}
+    )
+    changed = _changed(
+        old_settings,
+        new_settings,
+        sorted((set(old_settings) | set(new_settings)) - classified),
+    )
+    if changed:
+        plan.reasons.append(f"{', '.join(changed)} changed")
+        plan.render(modules)
+
+    # module specific settings
+    default = module_schema.validate({})
+    old_per_module = old_settings["Modules"] or {}
+    new_per_module = new_settings["Modules"] or {}
+    transformed = set()
+
+    for m in modules:
+        if m not in old_modules:
+            continue
+
+        old_m = old_per_module.get(m, default)
+        new_m = new_per_module.get(m, default)
+
+        if old_m == new_m:
+            continue
+
+        if old_m["module_parsing_header"] != new_m["module_parsing_header"]:
+            plan.reasons.append(f"{m}: module_parsing_header changed")
+            plan.parse([m])
+            plan.render(modules)
+
+        old_ph, new_ph = old_m["parsing_headers"], new_m["parsing_headers"]
+        headers = set(
+            h for h in set(old_ph) | set(new_ph) if old_ph.get(h) != new_ph.get(h)
+        )
+        if headers:
+            plan.reasons.append(f"{m}: parsing_headers changed")
+            plan.parse([m], headers)
+            plan.render(modules)
+
+        changed = _changed(old_m, new_m, MODULE_GLOBAL_SETTINGS)
+        if changed:
+            plan.reasons.append(f"{m}: {', '.join(changed)} changed")
+            plan.transform([m])
+            plan.render(modules)
+
+        changed = _changed(old_m, new_m, MODULE_TRANSFORM_SETTINGS)
+        if changed:
+            plan.reasons.append(f"{m}: {', '.join(changed)} changed")
+            plan.transform([m])
+            transformed.add(m)
+
+        changed = _changed(
+            old_m,
+            new_m,
+            sorted(
+                set(new_m)
+                - set(MODULE_GLOBAL_SETTINGS)
+                - set(MODULE_TRANSFORM_SETTINGS)
+                - {"module_parsing_header", "parsing_headers"}
+            ),
+        )
+        if changed:
+            plan.reasons.append(f"{m}: {', '.join(changed)} changed")
+            plan.render([m])
+
+    # subclasses in other modules render the inherited virtual methods
+    if transformed and not plan.render_all:
+        plan.render(get_dependents(transformed, get_dependencies()))
+
+    return plan
+
+
+def estimate(plan, files, timings, times) -> Dict[str, Any]:
+    """Estimated cost of the plan in seconds
+
+    Parsing times are taken per header (or per umbrella TU) from timings.json,
+    transformation and rendering times from the average per module of the
+    last complete run of the corresponding stage.
+    """
+
+    parse = 0.0
+    headers = 0
+    unknown = 0
+
+    for m, names in plan.reparse.items():
+        paths = [p for p in files.get(m, []) if names is None or p.name in names]
+        headers += len(paths)
+
+        if names is None and m in timings:
+            parse += timings[m]
+            continue
+
+        for p in paths:
+            if p.name in timings:
+                parse += timings[p.name]
+            else:
+                unknown += 1
+
+    def _per_module(stage, n):
+
+        t, count = times.get(stage, (None, 0))
+
+        return t / count * n if count else None
+
+    return dict(
+        parse=parse if unknown < headers else None,
+        headers=headers,
+        unknown=unknown,
+        transform=_per_module("transform", len(plan.retransform)),
+        render=_per_module("render", len(plan.rerender)),
+    )
+
+
+def describe(plan, cost) -> str:
+
+    def _seconds(t):
+
+        return f"~{t:.1f} s" if t is not None else "unknown cost"
+
+    n = len(plan.modules)
+    lines = [f"- {reason}" for reason in plan.reasons]
+
+    if not plan:
+        lines.append("nothing to do")
+        return "\n".join(lines)
+
+    parse = (
+        f"reparse {cost['headers']} headers of {len(plan.reparse)} modules "
+        f"({_seconds(cost['parse'])}"
+    )
+    if cost["unknown"]:
+        parse += f", {cost['unknown']} headers without timings"
+    if plan.reparse:
+        lines.append(parse + ")")
+
+    for m in sorted(plan.reparse):
+        names = plan.reparse[m]
+        names = "all headers" if names is None else ", ".join(sorted(names))
+        lines.append(f"  {m}: {names}")
+
+    lines.append(
+        f"retransform {len(plan.retransform)} of {n} modules "
+        f"({_seconds(cost['transform'])})"
+    )
+    if plan.retransform:
+        lines.append(f"  {', '.join(sorted(plan.retransform))}")
+
+    lines.append(
+        f"rerender {len(plan.rerender)} of {n} modules ({_seconds(cost['render'])})"
+    )
+    if plan.rerender and not plan.render_all:
+        lines.append(f"  {', '.join(sorted(plan.rerender))}")
+
+    return "\n".join(lines)
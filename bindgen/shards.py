@@ -0,0 +1,102 @@
+import pickle
+
+from hashlib import sha256
+from tempfile import mkdtemp
+from typing import Optional
+from uuid import uuid4
+
+from path import Path
+
+from . import columnar
+
+
+class Shard(object):
+    """Handle of a serialized object stored in a file
+
+    Workers pickle their results to temporary shards and return only the
+    handle, the driver loads the object when it actually needs it instead of
+    receiving it through the worker pipe. Temporary shards are removed once
+    loaded. Handles with a digest (e.g. of IR module files) are checked
+    against it when loaded.
+    """
+
+    path: Path
+    temporary: bool
+    digest: Optional[str]
+
+    def __init__(self, path, temporary=False, digest=None):
+
+        self.path = Path(path)
+        self.temporary = temporary
+        self.digest = digest
+
+    @classmethod
+    def dump(cls, obj, folder, temporary=True):
+
+        rv = cls(Path(folder) / f"{uuid4().hex}.pkl", temporary)
+
+        with open(rv.path, "wb") as f:
+            pickle.dump(obj, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+        return rv
+
+    def _read(self):
+
+        with open(self.path, "rb") as f:
+            data = f.read()
+
+        if sha256(data).hexdigest() != self.digest:
+            raise ValueError(f"{self.path} does not match its digest")
+
+        return data
+
+    def load(self):
+
+        columnar_file = self.path.suffix == columnar.SUFFIX
+
+        if self.digest:
+            data = self._read()
+            rv = columnar.loads(data) if columnar_file else pickle.loads(data)
+        elif columnar_file:
+            rv = columnar.load(self.path)
+        else:
+            with open(self.path, "rb") as f:
+                rv = pickle.load(f)
+
+        if self.temporary:
+            self.path.remove_p()
+
+        return rv
+
+
+class ShardFolder(object):
+    """Private folder for shards exchanged with worker processes
+
+    The folder is created in the default temporary location (see TMPDIR)
+    and removed with all remaining shards on exit or cleanup.
+    """
+
+    path: Path
+
+    def __init__(self):
+
+        self.path = Path(mkdtemp(prefix="bindgen-"))
+
+    def __enter__(self):
+
+        return self.path
+
+    def __exit__(self, *args):
+
+        self.cleanup()
+
+    def cleanup(self):
+
+        self.path.rmtree_p()
+
+
+def load(obj):
+    """Resolve obj if it is a Shard
+    """
+
+    return obj.load() if isinstance(obj, Shard) else obj
@@ -0,0 +1,235 @@
+import os
+import mmap
+import struct
+
+from array import array
+from bisect import bisect_left
+from hashlib import sha256
+from typing import Iterable, List, Set
+
+from path import Path
+
+# binary symbol table layout (native byte order, checked with ORDER):
+#   header: MAGIC, VERSION, ORDER, count, blob size, sha256 of the names
+#   offsets: count + 1 uint64 into the blob of sorted names
+#   blob: utf-8 encoded names sorted bytewise
+#   suffixes: count uint32 indices of the names sorted by their reversed bytes
+MAGIC = b"BGSYMTAB"
+VERSION = 1
+ORDER = 0x01020304
+HEADER = struct.Struct("8sIIQQ32s")
+
+
+def is_symbol_table(p):
+    """Check if p is a binary symbol table
+    """
+
+    with open(p, "rb") as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+class SymbolTable(object):
+    """Exported symbols supporting fast exact, prefix and suffix queries
+
+    Prefix and suffix queries are answered by bisecting the sorted names and
+    the sorted reversed names respectively.
+    """
+
+    names: Set[str]
+    prefixes: List[str]
+    suffixes: List[str]
+
+    def __init__(self, names: Iterable[str]):
+
+        # same semantics as the pandas str accessor - non-strings never match
+        self.names = set(n for n in names if isinstance(n, str))
+        self.prefixes = sorted(self.names)
+        self.suffixes = sorted(n[::-1] for n in self.names)
+
+    def __contains__(self, name):
+
+        return name in self.names
+
+    def __len__(self):
+
+        return len(self.names)
+
+    @property
+    def digest(self):
+        """Content hash of the symbols
+        """
+
+        return sha256(b"\0".join(n.encode() for n in self.prefixes)).hexdigest()
+
+    @staticmethod
+    def _bisect(names, s):
+
+        i = bisect_left(names, s)
+
+        return i < len(names) and names[i].startswith(s)
+
+    def has_prefix(self, prefix: str) -> bool:
+        """Check if any symbol starts with prefix
+        """
+
+        return prefix in self.names or self._bisect(self.prefixes, prefix)
+
+    def has_suffix(self, suffix: str) -> bool:
+        """Check if any symbol ends with suffix
+        """
+
+        return suffix in self.names or self._bisect(self.suffixes, suffix[::-1])
+
+    def save(self, p):
+        """Store as a binary symbol table that can be opened with MappedSymbolTable
+        """
+
+        # code point order of str equals the byte order of utf-8
+        names = [n.encode() for n in self.prefixes]
+        suffixes = sorted(range(len(names)), key=lambda i: names[i][::-1])
+
+        offsets = array("Q", [0])
+        for n in names:
+            offsets.append(offsets[-1] + len(n))
+
+        tmp = f"{p}.tmp.{os.getpid()}"
+
+        with open(tmp, "wb") as f:
+            f.write(
+                HEADER.pack(
+                    MAGIC,
+                    VERSION,
+                    ORDER,
+                    len(names),
+                    offsets[-1],
+                    sha256(b"\0".join(names)).digest(),
+                )
+            )
+            f.write(offsets.tobytes())
+            f.write(b"".join(names))
+            f.write(array("I", suffixes).tobytes())
+
+        os.replace(tmp, p)
+
+
+class _Names(object):
+    """Lazy sequence of (optionally reversed) names stored in a mapped table
+    """
+
+    def __init__(self, table, order=None, reverse=False):
+
+        self.table = table
+        self.order = order
+        self.reverse = reverse
+
+    def __len__(self):
+
+        return self.table.count
+
+    def __getitem__(self, i):
+
+        if self.order is not None:
+            i = self.order[i]
+
+        rv = self.table.name(i)
+
+        return rv[::-1] if self.reverse else rv
+
+
+class MappedSymbolTable(object):
+    """Binary symbol table opened zero-copy via mmap
+
+    Provides the query interface of SymbolTable. Only the path is pickled,
+    so passing it to worker processes is cheap.
+    """
+
+    path: Path
+    count: int
+
+    def __init__(self, path):
+
+        self._open(Path(path))
+
+    def _open(self, path):
+
+        self.path = path
+
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, order, count, size, digest = HEADER.unpack_from(self._mm)
+
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a supported symbol table")
+        if order != ORDER:
+            raise ValueError(f"{path} was built on a platform with different byte order")
+
+        self.count = count
+        self._digest = digest
+
+        view = memoryview(self._mm)
+        start = HEADER.size
+        self._offsets = view[start : start + 8 * (count + 1)].cast("Q")
+
+        self._blob = start + 8 * (count + 1)
+        start = self._blob + size
+        self._suffixes = view[start : start + 4 * count].cast("I")
+
+        self._prefixes = _Names(self)
+        self._reversed = _Names(self, self._suffixes, True)
+
+    def __getstate__(self):
+
+        return {"path": self.path}
+
+    def __setstate__(self, state):
+
+        self._open(state["path"])
+
+    def close(self):
+        """Release the mapping (required before removing the file on Windows)
+        """
+
+        self._offsets.release()
+        self._suffixes.release()
+        self._mm.close()
+
+    def __len__(self):
+
+        return self.count
+
+    def __contains__(self, name):
+
+        s = name.encode()
+        i = bisect_left(self._prefixes, s)
+
+        return i < self.count and self._prefixes[i] == s
+
+    @property
+    def digest(self):
+        """Content hash of the symbols
+        """
+
+        return self._digest.hex()
+
+    def name(self, i):
+
+        return self._mm[self._blob + self._offsets[i] : self._blob + self._offsets[i + 1]]
+
+    def _bisect(self, names, s):
+
+        i = bisect_left(names, s)
+
+        return i < self.count and names[i].startswith(s)
+
+    def has_prefix(self, prefix: str) -> bool:
+        """Check if any symbol starts with prefix
+        """
+
+        return self._bisect(self._prefixes, prefix.encode())
+
+    def has_suffix(self, suffix: str) -> bool:
+        """Check if any symbol ends with suffix
+        """
+
+        return self._bisect(self._reversed, suffix.encode()[::-1])
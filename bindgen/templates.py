@@ -0,0 +1,146 @@
+import os
+import json
+
+from hashlib import sha256
+from typing import List
+
+import jinja2
+
+from jinja2 import (
+    ChoiceLoader,
+    Environment,
+    FileSystemBytecodeCache,
+    FileSystemLoader,
+    ModuleLoader,
+)
+from logzero import logger
+from path import Path
+
+# precompiled templates are stored next to the templates with highest priority
+# unless the precompiled_templates setting points elsewhere
+PRECOMPILED = "compiled"
+MANIFEST = "templates.json"
+
+# template bytecode is stored in this subfolder of the cache
+BYTECODE = "templates"
+
+
+def template_paths(settings) -> List[Path]:
+    """Template search path: the user template_path (if any) before the defaults
+    """
+
+    default_path = [Path(__file__).dirname()]
+    additional_path = (
+        [Path(settings["template_path"])] if settings["template_path"] else []
+    )
+
+    return additional_path + default_path
+
+
+def precompiled_path(settings) -> Path:
+    """Folder of the precompiled templates, written by precompile and used by
+    make_loader
+    """
+
+    if settings["precompiled_templates"]:
+        return Path(settings["precompiled_templates"])
+
+    return template_paths(settings)[0] / PRECOMPILED
+
+
+def _environment(loader, bytecode_cache=None):
+
+    return Environment(
+        loader=loader,
+        trim_blocks=True,
+        lstrip_blocks=True,
+        extensions=["jinja2.ext.do"],
+        bytecode_cache=bytecode_cache,
+    )
+
+
+def sources_digest(paths) -> str:
+    """Digest of the templates resolved on paths and of the jinja2 version
+    """
+
+    env = _environment(FileSystemLoader(paths))
+    rv = sha256(jinja2.__version__.encode())
+
+    for name in env.list_templates(extensions=["j2"]):
+        source, _, _ = env.loader.get_source(env, name)
+        rv.update(name.encode())
+        rv.update(sha256(source.encode()).digest())
+
+    return rv.hexdigest()
+
+
+def precompile(paths, target) -> Path:
+    """Compile the templates resolved on paths to python modules in target
+
+    The target is replaced as a whole, so it must not exist or hold the
+    results of a previous call.
+    """
+
+    paths = [Path(p) for p in paths]
+    target = Path(target)
+
+    # never remove a folder that was not written here, e.g. the package itself
+    empty = os.path.isdir(target) and not os.listdir(target)
+    if target.exists() and not empty and not (target / MANIFEST).exists():
+        raise ValueError(f"{target} is not empty and holds no precompiled templates")
+
+    env = _environment(FileSystemLoader(paths))
+
+    target.rmtree_p()
+    env.compile_templates(target, extensions=["j2"], zip=None, ignore_errors=False)
+
+    with open(target / MANIFEST, "w") as f:
+        json.dump(
+            dict(
+                digest=sources_digest(paths),
+                templates=env.list_templates(extensions=["j2"]),
+            ),
+            f,
+            indent=1,
+        )
+
+    return target
+
+
+def make_loader(paths, precompiled=None):
+    """Loader preferring up to date precompiled templates over the sources
+    """
+
+    paths = [Path(p) for p in paths]
+    loader = FileSystemLoader(paths)
+    precompiled = Path(precompiled) if precompiled else paths[0] / PRECOMPILED
+
+    if not (precompiled / MANIFEST).exists():
+        return loader
+
+    with open(precompiled / MANIFEST) as f:
+        manifest = json.load(f)
+
+    if manifest.get("digest") != sources_digest(paths):
+        logger.warning(f"Ignoring outdated precompiled templates in {precompiled}")
+        return loader
+
+    return ChoiceLoader([ModuleLoader(precompiled), loader])
+
+
+def make_template_environment(paths, cache=None, precompiled=None):
+    """Jinja environment loading the templates from paths
+
+    With a cache folder the compiled templates are stored in it and reused
+    as long as the template source is unchanged. Up to date precompiled
+    templates are used if found in precompiled.
+    """
+
+    bytecode_cache = None
+
+    if cache:
+        folder = Path(cache) / BYTECODE
+        folder.makedirs_p()
+        bytecode_cache = FileSystemBytecodeCache(folder)
+
+    return _environment(make_loader(paths, precompiled), bytecode_cache)
@@ -1,43 +1,57 @@
+import os
+import pickle
 import logzero
 import pybind11
 
+from functools import partial
+
 from clang.cindex import TranslationUnit as TU
+from path import Path
 
-from .utils import get_index, get_includes
+from .utils import (
+    get_index,
+    get_includes,
+    get_clang_version,
+    digest,
+    file_digest,
+    includes_valid,
+)
 
+DEFAULT_ARGS = [
+    "-x",
+    "c++",
+    "-std=c++17",
+    "-D__CODE_GENERATOR__",
+    "-Wno-deprecated-declarations",
+]
 
-def parse_tu(
-    path,
-    input_folder,
-    prefix=None,
-    platform_includes=[],
-    args=[
-        "-x",
-        "c++",
-        "-std=c++17",
-        "-D__CODE_GENERATOR__",
-        "-Wno-deprecated-declarations",
-    ],
-    parsing_header="",
-    tu_parsing_header="",
-    platform_parsing_header="",
-):
-    """Run a translation unit thorugh clang
+pchs = {}
+
+
+def get_args(input_folder, prefix=None, platform_includes=[], args=DEFAULT_ARGS):
+    """Construct the clang command line
     """
 
-    args.append(f"-I{pybind11.get_include()}")
-    args.append(f"-I{input_folder}")
+    rv = list(args)
+
+    rv.append(f"-I{pybind11.get_include()}")
+    rv.append(f"-I{input_folder}")
 
     if prefix:
-        args.append(f"--sysroot={prefix}")
+        rv.append(f"--sysroot={prefix}")
 
     for inc in get_includes():
-        args.append(f"-I{inc}")
+        rv.append(f"-I{inc}")
 
     for inc in platform_includes:
-        args.append(f"-I{inc}")
+        rv.append(f"-I{inc}")
 
-    ix = get_index()
+    return rv
+
+
+def get_source(path, parsing_header="", tu_parsing_header="", platform_parsing_header=""):
+    """Construct the source code of the dummy translation unit
+    """
 
     with open(path) as f:
         src = f.read()
@@ -46,22 +60,228 @@ def parse_tu(
     if src[0] == "\ufeff":
         src = src[1:]
 
-    dummy_code = (
-        f"{parsing_header}\n{platform_parsing_header}\n{tu_parsing_header}\n{src}"
-    )
-    tr_unit = ix.parse(
-        "dummy.cxx",
-        args,
-        unsaved_files=[("dummy.cxx", dummy_code)],
+    return f"{parsing_header}\n{platform_parsing_header}\n{tu_parsing_header}\n{src}"
+
+
+def get_umbrella_source(
+    paths, parsing_header="", tu_parsing_header="", platform_parsing_header=""
+):
+    """Construct the source code of a dummy translation unit including all paths
+    """
+
+    src = "".join(f"#include <{p.name}>\n" for p in paths)
+
+    return f"{parsing_header}\n{platform_parsing_header}\n{tu_parsing_header}\n{src}"
+
+
+def get_pch(prologue, args, pch_folder):
+    """Build or reuse a precompiled header for the prologue shared by all TUs
+
+    Returns the PCH location (None if it cannot be built) together with the
+    (source, include) pairs of the inclusions it contains.
+    """
+
+    folder = Path(pch_folder) / digest(prologue, args, get_clang_version())
+
+    if folder in pchs:
+        return pchs[folder]
+
+    pch = folder / "dummy.pch"
+    manifest = folder / "includes.pkl"
+    tmp = folder / f"tmp.{os.getpid()}"
+
+    if manifest.exists():
+        with open(manifest, "rb") as f:
+            inclusions, includes = pickle.load(f)
+
+        if includes_valid(includes):
+            pchs[folder] = pch, inclusions
+            return pchs[folder]
+
+    # the prologue is stored as dummy.hxx so that its symbols are still
+    # approximately equal to the dummy.cxx TU path
+    src = folder / "dummy.hxx"
+
+    folder.makedirs_p()
+    if not src.exists():
+        tmp.write_text(prologue)
+        try:
+            # never overwrite - the mtime is validated by clang
+            os.link(tmp, src)
+        except FileExistsError:
+            pass
+        tmp.remove()
+
+    tr_unit = get_index().parse(
+        src,
+        ["c++-header" if arg == "c++" else arg for arg in args],
         options=TU.PARSE_INCOMPLETE,
     )
 
+    if any(d.severity > 2 for d in tr_unit.diagnostics):
+        logzero.logger.warning("Precompiled header could not be built")
+        pchs[folder] = None, []
+        return pchs[folder]
+
+    tr_unit.save(tmp)
+    os.replace(tmp, pch)
+
+    inclusions = [
+        (el.location.file.name, el.include.name) for el in tr_unit.get_includes()
+    ]
+    includes = sorted(set(inc for _, inc in inclusions) | {src})
+
+    with open(tmp, "wb") as f:
+        pickle.dump((inclusions, [(p, file_digest(p)) for p in includes]), f)
+    os.replace(tmp, manifest)
+
+    pchs[folder] = pch, inclusions
+
+    return pchs[folder]
+
+
+def load_ast(key, ast_folder):
+    """Load a saved TU if none of its includes changed
+    """
+
+    ast = Path(ast_folder) / key[:2] / key + ".ast"
+    manifest = ast.stripext() + ".pkl"
+
+    if not manifest.exists():
+        return None
+
+    try:
+        with open(manifest, "rb") as f:
+            inclusions, includes = pickle.load(f)
+
+        if not includes_valid(includes):
+            return None
+
+        tr_unit = TU.from_ast_file(ast, get_index())
+    except Exception:
+        return None
+
+    # reloaded TUs report absolute paths, use the ones of the original parse
+    tr_unit.inclusions = inclusions
+
+    # mark as recently used
+    os.utime(ast)
+
+    return tr_unit
+
+
+def save_ast(key, tr_unit, ast_folder):
+    """Save a TU together with its inclusions and the digests of its includes
+    """
+
+    ast = Path(ast_folder) / key[:2] / key + ".ast"
+    manifest = ast.stripext() + ".pkl"
+    tmp = ast.stripext() + f".tmp.{os.getpid()}"
+
+    ast.dirname().makedirs_p()
+
+    tr_unit.save(tmp)
+    os.replace(tmp, ast)
+
+    includes = sorted(set(inc for _, inc in tr_unit.inclusions))
+
+    with open(tmp, "wb") as f:
+        pickle.dump(
+            (tr_unit.inclusions, [(p, file_digest(p)) for p in includes]), f
+        )
+    os.replace(tmp, manifest)
+
+
+def _parse(
+    name,
+    get_code,
+    input_folder,
+    prefix=None,
+    platform_includes=[],
+    args=DEFAULT_ARGS,
+    parsing_header="",
+    tu_parsing_header="",
+    platform_parsing_header="",
+    pch_folder=None,
+    ast_folder=None,
+    options=TU.PARSE_INCOMPLETE,
+):
+    """Parse the dummy TU whose source is returned by get_code
+
+    If ast_folder is given the TU is saved there and reloaded in later runs
+    as long as the inputs do not change.
+    """
+
+    args = get_args(input_folder, prefix, platform_includes, args)
+
+    ix = get_index()
+
+    # global and platform parsing headers are identical for all TUs,
+    # TUs using a PCH cannot be reloaded by libclang
+    pch, pch_inclusions = None, []
+    if pch_folder and not ast_folder:
+        pch, pch_inclusions = get_pch(
+            f"{parsing_header}\n{platform_parsing_header}\n", args, pch_folder
+        )
+
+    if pch:
+        args.extend(("-include-pch", pch))
+        dummy_code = get_code(tu_parsing_header=tu_parsing_header)
+    else:
+        dummy_code = get_code(
+            parsing_header, tu_parsing_header, platform_parsing_header
+        )
+    tr_unit = None
+    if ast_folder:
+        key = digest(dummy_code, args, options, get_clang_version())
+        tr_unit = load_ast(key, ast_folder)
+
+    if tr_unit is None:
+        tr_unit = ix.parse(
+            "dummy.cxx",
+            args,
+            unsaved_files=[("dummy.cxx", dummy_code)],
+            options=options,
+        )
+        tr_unit.inclusions = [
+            (el.location.file.name, el.include.name) for el in tr_unit.get_includes()
+        ]
+
+        if ast_folder:
+            save_ast(key, tr_unit, ast_folder)
+
     diag = list(tr_unit.diagnostics)
     if diag:
-        logzero.logger.warning(path)
+        logzero.logger.warning(name)
         for d in diag:
             logzero.logger.warning(d)
 
+    tr_unit.pch_inclusions = pch_inclusions
+
+    return tr_unit
+
+
+def parse_tu(path, input_folder, **kwargs):
+    """Run a translation unit thorugh clang
+    """
+
+    tr_unit = _parse(path, partial(get_source, path), input_folder, **kwargs)
     tr_unit.path = ("dummy.cxx", path.name)
 
     return tr_unit
+
+
+def parse_umbrella_tu(paths, input_folder, **kwargs):
+    """Run a single translation unit including all paths thorugh clang
+
+    The detailed processing record is needed to recover the include graph
+    of every header, also of the ones entered only once due to include guards.
+    """
+
+    return _parse(
+        paths[0].dirname(),
+        partial(get_umbrella_source, paths),
+        input_folder,
+        options=TU.PARSE_INCOMPLETE | TU.PARSE_DETAILED_PROCESSING_RECORD,
+        **kwargs,
+    )
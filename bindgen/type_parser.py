@@ -1,4 +1,7 @@
-from pyparsing import Word, Literal, alphas, alphanums, Optional
+from functools import lru_cache
+from typing import Iterable
+
+from pyparsing import Word, Literal, Suppress, Or, alphas, alphanums, Optional
 
 
 CONST = Literal("const")
@@ -15,7 +18,59 @@ parser = (
     + Optional(PTR_REF)
 )
 
+# number of type strings memoized per analysis
+CACHE_SIZE = 2 ** 16
+
 
+@lru_cache(CACHE_SIZE)
 def parse_type(t):
 
     return parser.parseString(t).type
+
+
+class TypeMatcher(object):
+    """Analysis of type strings against a list of type names (e.g. byref_types)
+
+    The grammar is built once per matcher and the results are memoized per
+    type string.
+    """
+
+    def __init__(self, types: Iterable[str]):
+
+        self.types = tuple(types)
+        self._grammar = None
+
+        self.matches = lru_cache(CACHE_SIZE)(self._matches)
+        self.pointee = lru_cache(CACHE_SIZE)(self._pointee)
+
+    def _matches(self, t: str) -> bool:
+        """Check if t is a non-const reference to one of the types
+        """
+
+        return t.endswith("&") and t.startswith(self.types)
+
+    def _pointee(self, t: str) -> str:
+        """Extract T from a reference to one of the smart pointer types Ptr<T>&
+        """
+
+        if self._grammar is None:
+            self._grammar = (
+                Suppress(Or(map(Literal, self.types)) + Literal("<"))
+                + Word(alphanums + "_")
+                + Suppress(Literal(">") + Literal("&"))
+            )
+
+        return self._grammar.parseString(t)[0]
+
+
+@lru_cache(64)
+def _type_matcher(types):
+
+    return TypeMatcher(types)
+
+
+def type_matcher(types: Iterable[str]) -> TypeMatcher:
+    """Shared matcher of the given types
+    """
+
+    return _type_matcher(tuple(types))
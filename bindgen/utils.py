@@ -1,13 +1,23 @@
-from clang.cindex import Config, Index, Cursor
+from clang.cindex import Config, Index, Cursor, SourceRange, _CXString
 from ctypes import c_uint
+from hashlib import sha256
 from path import Path
-from os import getenv
+from os import getenv, stat, chmod, replace, remove, umask, linesep
+from locale import getpreferredencoding
+from tempfile import NamedTemporaryFile
 from sys import platform, prefix
 
-from .cymbal import monkeypatch_cursor
+from .cymbal import monkeypatch_cursor, find_libclang_function
 
 initialized = False
 ix = None
+file_digests = {}
+
+# size of the blocks copied when streaming files
+BLOCK_SIZE = 1 << 20
+
+# size of the text batches compared and written when streaming templates
+BATCH_SIZE = 1 << 16
 
 
 def current_platform():
@@ -89,6 +99,10 @@ def init_clang(path=None):
             "get_num_overloaded_decl", "clang_getNumOverloadedDecls", [Cursor], c_uint
         )
 
+        monkeypatch_cursor(
+            "get_comment_extent", "clang_Cursor_getCommentRange", [Cursor], SourceRange
+        )
+
         initialized = True
         ix = Index.create()
 
@@ -101,3 +115,193 @@ def get_index():
         init_clang()
 
     return ix
+
+
+def get_clang_version():
+
+    get_index()
+
+    f = find_libclang_function("clang_getClangVersion")
+    f.argtypes = []
+    f.restype = _CXString
+
+    return _CXString.from_result(f())
+
+
+def digest(*parts):
+    """Stable hash of the provided parts
+    """
+
+    h = sha256()
+    for p in parts:
+        h.update(repr(p).encode())
+        h.update(b"\0")
+
+    return h.hexdigest()
+
+
+def _canonical(obj):
+
+    if obj is None or isinstance(obj, (str, int, float)):
+        return obj
+    elif isinstance(obj, (list, tuple)):
+        return tuple(_canonical(el) for el in obj)
+    elif isinstance(obj, (set, frozenset)):
+        return ("set", tuple(sorted((_canonical(el) for el in obj), key=repr)))
+    elif isinstance(obj, dict):
+        return (
+            "dict",
+            tuple(sorted(((_canonical(k), _canonical(v)) for k, v in obj.items()), key=repr)),
+        )
+    elif hasattr(obj, "__dict__"):
+        return (type(obj).__name__, _canonical(vars(obj)))
+    elif hasattr(obj, "__slots__"):
+        return (type(obj).__name__, _canonical(obj.__getstate__()))
+
+    return repr(obj)
+
+
+def object_digest(obj):
+    """Stable hash of an object graph
+
+    Unlike pickles the result does not depend on the iteration order of sets
+    and dicts, so it can be compared across processes and runs.
+    """
+
+    return digest(_canonical(obj))
+
+
+def file_digest(p):
+    """Hash of the file content, memoized on mtime and size
+    """
+
+    st = stat(p)
+    stamp = (st.st_mtime_ns, st.st_size)
+
+    rv = file_digests.get(p)
+    if rv is None or rv[0] != stamp:
+        with open(p, "rb") as f:
+            rv = (stamp, sha256(f.read()).hexdigest())
+        file_digests[p] = rv
+
+    return rv[1]
+
+
+def _default_mode():
+
+    mask = umask(0)
+    umask(mask)
+
+    return 0o666 & ~mask
+
+
+def _encode(chunk):
+    """Encode text like a file opened with open(p, "w") does
+    """
+
+    if isinstance(chunk, str):
+        if linesep != "\n":
+            chunk = chunk.replace("\n", linesep)
+        chunk = chunk.encode(getpreferredencoding(False))
+
+    return chunk
+
+
+def _batched(chunks, size=BATCH_SIZE):
+    """Join the many small chunks generated by templates into larger ones
+    """
+
+    batch = []
+    n = 0
+
+    for chunk in chunks:
+        batch.append(chunk)
+        n += len(chunk)
+
+        if n >= size:
+            yield "".join(batch)
+            batch.clear()
+            n = 0
+
+    if batch:
+        yield "".join(batch)
+
+
+def write_if_changed(p, data, mode=None):
+    """Atomically replace the file p with data unless it already has this content
+
+    data is str, bytes or an iterable of str chunks (e.g. Template.generate()),
+    which is streamed to the file. The chunks are compared with the existing
+    content as they come and a temporary file is only started at the first
+    difference, so neither content is held in memory. Text is written like
+    open(p, "w") would. Unchanged files keep their mtime, so build systems do
+    not consider them outdated. Returns True if p was written.
+    """
+
+    p = Path(p)
+    chunks = [data] if isinstance(data, (str, bytes)) else _batched(data)
+
+    old = open(p, "rb") if p.exists() else None
+    new = None
+    same = 0  # length of the prefix identical to the old content
+
+    def _start():
+
+        rv = NamedTemporaryFile(
+            "wb", dir=p.dirname(), prefix=f".{p.name}.", delete=False
+        )
+
+        if old is not None:
+            old.seek(0)
+            remaining = same
+            while remaining:
+                block = old.read(min(remaining, BLOCK_SIZE))
+                rv.write(block)
+                remaining -= len(block)
+
+        return rv
+
+    try:
+        for chunk in map(_encode, chunks):
+            if new is None and old is not None and old.read(len(chunk)) == chunk:
+                same += len(chunk)
+                continue
+
+            if new is None:
+                new = _start()
+
+            new.write(chunk)
+
+        if new is None:
+            if old is not None and not old.read(1):
+                return False
+
+            new = _start()
+
+        new.close()
+    except BaseException:
+        if new is not None:
+            new.close()
+            remove(new.name)
+        raise
+    finally:
+        if old is not None:
+            old.close()
+
+    if mode is None and p.exists():
+        mode = stat(p).st_mode
+
+    chmod(new.name, (mode if mode is not None else _default_mode()) & 0o7777)
+    replace(new.name, p)
+
+    return True
+
+
+def includes_valid(includes):
+    """Check if all (path, hash) pairs still match the file system
+    """
+
+    try:
+        return all(file_digest(p) == d for p, d in includes)
+    except OSError:
+        return False
@@ -0,0 +1,321 @@
+from typing import Any, Callable, Dict, Iterable, Set, Tuple
+
+
+def proper_new_operator(cls):
+
+    new_ops = [op for op in cls.static_operators if op.name == "operator new"]
+
+    if not new_ops:
+        return True
+
+    new_ops = [op for op in new_ops if len(op.args) == 1]
+
+    return new_ops
+
+
+def proper_delete_operator(cls):
+
+    del_ops = [op for op in cls.static_operators if op.name ==
+               "operator delete"]
+
+    if not del_ops:
+        return True
+
+    del_ops = [op for op in del_ops if len(op.args) == 1]
+
+    return del_ops
+
+
+def references_inner(name, method):
+
+    return name + "::" in method.return_type or any(
+        [name + "::" in a for _, a, _ in method.args]
+    )
+
+
+# signature helpers, called for every method and thus kept out of macros.j2
+
+
+def _types(args, fmt=str) -> str:
+
+    n = len(args) - 1
+
+    return "".join(
+        f" {fmt(t)} {',' if i < n else ''} " for i, (_, t, _) in enumerate(args)
+    )
+
+
+def _const(f) -> str:
+
+    return "const" if f.const else ""
+
+
+def argtypes(f) -> str:
+
+    return ",".join(str(t) for _, t, _ in f.args)
+
+
+def argnames(f) -> str:
+
+    n = len(f.args) - 1
+
+    return "".join(
+        f" {',' if i == 0 else ''} py::arg(\"{arg if arg != '' else 'arg'}\")"
+        + (f"=static_cast<{t}>({d})" if d else "")
+        + ("," if i < n else "")
+        for i, (arg, t, d) in enumerate(f.args)
+    )
+
+
+def method_pointer(cls, f) -> str:
+
+    sig = f"{f.return_type} ({cls.name}::*)({_types(f.args)}) {_const(f)}"
+
+    return f"({sig}) static_cast<{sig}>(&{cls.name}::{f.name})"
+
+
+def static_method_pointer(cls, f) -> str:
+
+    sig = f"{f.return_type} (*)({_types(f.args)}) {_const(f)}"
+
+    return f"({sig}) static_cast<{sig}>(&{cls.name}::{f.name})"
+
+
+def function_pointer(f) -> str:
+
+    sig = f"{f.return_type} (*)({_types(f.args)})"
+    name = f"{f.namespace}::{f.name}" if f.namespace else f.name
+
+    return f"({sig})  static_cast<{sig}>(&{name})"
+
+
+def template_args(t) -> str:
+
+    return "<" + ",".join(str(name) for _, name, _ in t.type_params) + ">"
+
+
+def arg_type_with_template_params(template, t) -> str:
+
+    if not t.startswith(template.name + "::"):
+        return t
+
+    params = ", ".join(p[1] for p in template.type_params)
+
+    return f"typename {template.name}<{params}>{t.split(template.name)[-1]}"
+
+
+def argnames_template(template, f) -> str:
+
+    n = len(f.args) - 1
+
+    return "".join(
+        ("," if i == 0 else "")
+        + f"py::arg(\"{arg if arg != '' else 'arg'}\")"
+        + (
+            f"=static_cast<{arg_type_with_template_params(template, t)}>({d})"
+            if d
+            else ""
+        )
+        + (", " if i < n else "")
+        for i, (arg, t, d) in enumerate(f.args)
+    )
+
+
+def template_return_type(cls, f) -> str:
+
+    if not f.return_type.startswith(cls.name + "::"):
+        return f.return_type
+
+    return f"typename {cls.name}{template_args(cls)}::{f.return_type.split('::')[1]}"
+
+
+def template_method_pointer(cls, f) -> str:
+
+    types = _types(f.args, lambda t: arg_type_with_template_params(cls, t))
+    owner = f"{cls.name}{template_args(cls)}"
+
+    return (
+        f"({template_return_type(cls, f)} ({owner}::*)({types}) {_const(f)}) "
+        f"&{owner}::{f.name}"
+    )
+
+
+def template_static_method_pointer(cls, f) -> str:
+
+    types = _types(f.args, lambda t: arg_type_with_template_params(cls, t))
+    owner = f"{cls.name}{template_args(cls)}"
+
+    return (
+        f"({template_return_type(cls, f)} (*)({types}) {_const(f)}) "
+        f"&{owner}::{f.name}"
+    )
+
+
+SIGNATURES = (
+    argtypes,
+    argnames,
+    method_pointer,
+    static_method_pointer,
+    function_pointer,
+    template_args,
+    arg_type_with_template_params,
+    argnames_template,
+    template_return_type,
+    template_method_pointer,
+    template_static_method_pointer,
+)
+
+
+class IdMap(object):
+    """Values looked up by the identity of the objects they were computed for
+    """
+
+    def __init__(self, items: Iterable[Tuple[Any, Any]] = ()):
+
+        self.items = {id(k): (k, v) for k, v in items}
+
+    def __getitem__(self, obj):
+
+        return self.items[id(obj)][1]
+
+    def __contains__(self, obj):
+
+        return id(obj) in self.items
+
+
+class ByrefView(object):
+    """Arguments of a method returning some of them by reference
+
+    inputs are the (name, signature type, type, default) of the arguments
+    still passed from Python, outputs and pointers the (name, type) of the
+    arguments returned by reference and by smart pointer reference.
+    """
+
+    __slots__ = ("inputs", "outputs", "pointers", "call_args")
+
+    def __init__(self, f, is_byref, is_byref_smart_ptr, type_from_byref_smart_ptr):
+
+        self.inputs = []
+        self.outputs = []
+        self.pointers = []
+        self.call_args = []
+
+        for arg, t, d in f.args:
+            smart_ptr = is_byref_smart_ptr(t)
+
+            if is_byref(t):
+                self.outputs.append((arg, t))
+            else:
+                sig = type_from_byref_smart_ptr(t) + "&" if smart_ptr else t
+                self.inputs.append((arg, sig, t, d))
+
+            if smart_ptr:
+                self.pointers.append((arg, t))
+
+            self.call_args.append(arg + "_ptr" if smart_ptr else arg)
+
+
+class TrampolineView(object):
+    """Virtual methods a trampoline class overrides
+
+    The methods inherited from the superclasses are resolved once as (owner,
+    method) pairs, instead of iterating the methods of all superclasses in
+    the templates.
+    """
+
+    __slots__ = (
+        "public",
+        "inherited_public",
+        "protected",
+        "inherited_protected",
+        "private",
+        "inherited_private",
+    )
+
+    def __init__(self, c, all_classes):
+
+        parents = [all_classes.get(s, None) for s in c.superclasses]
+        parents = [p for p in parents if p]
+
+        self.public = [m for m in c.methods + c.methods_byref if m.pure_virtual]
+        overridden = set(m.full_name for m in self.public)
+
+        self.inherited_public = []
+        for p in parents:
+            for m in p.methods:
+                if (
+                    m.pure_virtual
+                    and m.name not in c.methods_dict
+                    and m.full_name not in overridden
+                ):
+                    self.inherited_public.append((p, m))
+                    overridden.add(m.full_name)
+
+        self.protected = list(c.protected_virtual_methods)
+        overridden.update(m.full_name for m in self.protected)
+
+        self.inherited_protected = []
+        for p in parents:
+            for m in p.protected_virtual_methods:
+                if (
+                    m.name not in c.protected_virtual_methods_dict
+                    and m.full_name not in overridden
+                ):
+                    self.inherited_protected.append((p, m))
+                    overridden.add(m.full_name)
+
+        # own private methods are not recorded as overridden
+        self.private = list(c.private_virtual_methods)
+
+        self.inherited_private = []
+        for p in parents:
+            for m in p.private_virtual_methods:
+                if (
+                    m.name not in c.private_virtual_methods_dict
+                    and m.full_name not in overridden
+                ):
+                    self.inherited_private.append((p, m))
+                    overridden.add(m.full_name)
+
+
+class ModuleView(object):
+    """Flags and derived data of a module computed once per entity for the
+    templates, so that they only iterate flat data
+    """
+
+    registered: Set[str]
+    trampolines: Dict[str, TrampolineView]
+    byref: IdMap
+    template_methods: IdMap
+
+    def __init__(
+        self,
+        m,
+        all_classes: Any,
+        is_byref: Callable[[str], bool],
+        is_byref_smart_ptr: Callable[[str], bool],
+        type_from_byref_smart_ptr: Callable[[str], str],
+    ):
+
+        # classes with usable new/delete operators or held by handles
+        self.registered = set(
+            c.name
+            for c in m.classes
+            if (proper_new_operator(c) and proper_delete_operator(c))
+            or "Standard_Transient" in c.rootclass
+        )
+
+        self.trampolines = {
+            c.name: TrampolineView(c, all_classes) for c in m.classes if c.abstract
+        }
+
+        self.byref = IdMap(
+            (f, ByrefView(f, is_byref, is_byref_smart_ptr, type_from_byref_smart_ptr))
+            for c in m.classes
+            for f in c.methods_byref + c.static_methods_byref
+        )
+
+        self.template_methods = IdMap(
+            (t, [f for f in t.methods if not references_inner(t.name, f)])
+            for t in m.class_templates
+        )
@@ -0,0 +1,258 @@
+"""Generate the shared library fixtures of test_exports.py
+
+Needs gcc and the LLVM tools (llvm-mc, obj2yaml, yaml2obj, llvm-lipo) on the
+PATH, e.g. PATH=/usr/lib/llvm-14/bin:$PATH python make.py. Mach-O and PE
+images are produced without a linker from yaml2obj descriptions, the results
+can be checked with llvm-nm --arch=all and llvm-readobj --coff-exports.
+"""
+
+import struct
+import subprocess
+
+import yaml
+
+from path import Path
+
+HERE = Path(__file__).dirname()
+
+ASM_X86 = """
+    .text
+    .globl _shared_func
+_shared_func:
+    ret
+    .globl _x86_only
+_x86_only:
+    ret
+_local_func:
+    ret
+    .globl _undefined_ref
+    .data
+    .globl _shared_data
+_shared_data:
+    .long 1
+"""
+
+ASM_ARM64 = """
+    .text
+    .globl _shared_func
+_shared_func:
+    ret
+    .globl _arm_only
+_arm_only:
+    ret
+    .data
+    .globl _shared_data
+_shared_data:
+    .long 1
+"""
+
+ELF_SOURCE = """
+int shared_data = 1;
+static int local_data = 2;
+__attribute__((visibility("hidden"))) int hidden_func(void) { return local_data; }
+__attribute__((weak)) int weak_func(void) { return 0; }
+extern int undefined_func(void);
+int shared_func(void) { return undefined_func() + hidden_func(); }
+"""
+
+PE_EXPORTS = ["shared_func", "shared_data", "?member@Cls@@QEAAXXZ"]
+
+# LC_ID_DYLIB with the install name, which dylibs require
+DYLIB_ID = b"libfixture.dylib"
+DYLIB_ID_SIZE = 48
+
+PE_TEMPLATE = """--- !COFF
+OptionalHeader:
+  AddressOfEntryPoint: 0
+  ImageBase: {image_base}
+  SectionAlignment: 4096
+  FileAlignment: 512
+  MajorOperatingSystemVersion: 6
+  MinorOperatingSystemVersion: 0
+  MajorImageVersion: 0
+  MinorImageVersion: 0
+  MajorSubsystemVersion: 6
+  MinorSubsystemVersion: 0
+  Subsystem: IMAGE_SUBSYSTEM_WINDOWS_CUI
+  DLLCharacteristics: [ ]
+  SizeOfStackReserve: 1048576
+  SizeOfStackCommit: 4096
+  SizeOfHeapReserve: 1048576
+  SizeOfHeapCommit: 4096
+  ExportTable:
+    RelativeVirtualAddress: {export_rva}
+    Size: {export_size}
+header:
+  Machine: IMAGE_FILE_MACHINE_{machine}
+  Characteristics: [ IMAGE_FILE_EXECUTABLE_IMAGE, IMAGE_FILE_DLL ]
+sections:
+  - Name: .text
+    Characteristics: [ IMAGE_SCN_CNT_CODE, IMAGE_SCN_MEM_EXECUTE, IMAGE_SCN_MEM_READ ]
+    VirtualAddress: 0x1000
+    VirtualSize: 4
+    SectionData: C3C3C3C3
+  - Name: .rdata
+    Characteristics: [ IMAGE_SCN_CNT_INITIALIZED_DATA, IMAGE_SCN_MEM_READ ]
+    VirtualAddress: 0x2000
+    VirtualSize: {rdata_size}
+    SectionData: {rdata}
+symbols: []
+...
+"""
+
+
+def _run(*args, **kwargs):
+
+    return subprocess.run(args, check=True, **kwargs)
+
+
+def make_dylib(triple, source, target):
+    """Assemble an object file and turn it into a dylib by adding LC_ID_DYLIB
+    """
+
+    obj = target.stripext() + ".o"
+    _run(
+        "llvm-mc", "-triple", triple, "-filetype=obj", "-o", obj, input=source.encode()
+    )
+
+    text = _run("obj2yaml", obj, capture_output=True, text=True).stdout
+    doc = yaml.safe_load(text.replace("--- !mach-o", "---"))
+    obj.remove()
+
+    header = doc["FileHeader"]
+    header["filetype"] = 0x6  # MH_DYLIB
+    header["ncmds"] += 1
+    header["sizeofcmds"] += DYLIB_ID_SIZE
+
+    # the new load command moves everything after the commands
+    for cmd in doc["LoadCommands"]:
+        if cmd["cmd"] in ("LC_SEGMENT", "LC_SEGMENT_64"):
+            cmd["fileoff"] += DYLIB_ID_SIZE
+            for section in cmd.get("Sections", []):
+                section["offset"] += DYLIB_ID_SIZE
+        elif cmd["cmd"] == "LC_SYMTAB":
+            cmd["symoff"] += DYLIB_ID_SIZE
+            cmd["stroff"] += DYLIB_ID_SIZE
+
+    doc["LoadCommands"].insert(
+        0,
+        dict(
+            cmd="LC_ID_DYLIB",
+            cmdsize=DYLIB_ID_SIZE,
+            dylib=dict(
+                name=24,
+                timestamp=1,
+                current_version=0x10000,
+                compatibility_version=0x10000,
+            ),
+            PayloadBytes=list(DYLIB_ID.ljust(DYLIB_ID_SIZE - 24, b"\0")),
+        ),
+    )
+
+    source = "--- !mach-o\n" + yaml.safe_dump(doc, sort_keys=False)
+    _run("yaml2obj", "-o", target, input=source, text=True)
+
+
+def export_directory(rva, dll, names, nfuncs):
+    """Export directory at rva with nfuncs functions, the first ones named
+    """
+
+    names = sorted(names)
+
+    functions = rva + 40
+    name_pointers = functions + 4 * nfuncs
+    ordinals = name_pointers + 4 * len(names)
+    strings = ordinals + 2 * len(names)
+
+    blob = dll.encode() + b"\0"
+    name_rvas = []
+    for name in names:
+        name_rvas.append(strings + len(blob))
+        blob += name.encode() + b"\0"
+
+    return (
+        struct.pack(
+            "<IIHHIIIIIII",
+            0,
+            0,
+            0,
+            0,
+            strings,
+            1,
+            nfuncs,
+            len(names),
+            functions,
+            name_pointers,
+            ordinals,
+        )
+        + struct.pack(f"<{nfuncs}I", *(0x1000 + i for i in range(nfuncs)))
+        + struct.pack(f"<{len(names)}I", *name_rvas)
+        + struct.pack(f"<{len(names)}H", *range(len(names)))
+        + blob
+    )
+
+
+def make_dll(machine, image_base, target, exports=True):
+    """DLL exporting PE_EXPORTS and one function by ordinal only
+    """
+
+    rdata = export_directory(0x2000, target.name, PE_EXPORTS, len(PE_EXPORTS) + 1)
+
+    source = PE_TEMPLATE.format(
+        image_base=image_base,
+        machine=machine,
+        export_rva=0x2000 if exports else 0,
+        export_size=len(rdata) if exports else 0,
+        rdata_size=len(rdata),
+        rdata=rdata.hex().upper(),
+    )
+    _run("yaml2obj", "-o", target, input=source, text=True)
+
+
+def make_so(target):
+
+    _run(
+        "gcc",
+        "-shared",
+        "-fPIC",
+        "-nostdlib",
+        "-Wl,--allow-shlib-undefined",
+        "-Wl,--build-id=none",
+        "-s",
+        "-o",
+        target,
+        "-x",
+        "c",
+        "-",
+        input=ELF_SOURCE.encode(),
+    )
+
+
+def main():
+
+    make_so(HERE / "fixture.so")
+
+    make_dll("AMD64", 0x180000000, HERE / "pe32plus.dll")
+    make_dll("I386", 0x10000000, HERE / "pe32.dll")
+    make_dll("AMD64", 0x180000000, HERE / "noexports.dll", exports=False)
+
+    thin = []
+    for triple, source in (
+        ("x86_64-apple-macos10.15", ASM_X86),
+        ("arm64-apple-macos11", ASM_ARM64),
+        ("i386-apple-macos10.13", ASM_X86),
+    ):
+        target = HERE / f"{triple.split('-')[0]}.dylib"
+        make_dylib(triple, source, target)
+        thin.append(target)
+
+    align = []
+    for arch in ("x86_64", "arm64", "i386"):
+        align += ["--segalign", arch, "10"]
+
+    _run("llvm-lipo", "-create", *thin, *align, "-output", HERE / "universal.dylib")
+
+
+if __name__ == "__main__":
+
+    main()
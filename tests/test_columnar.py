@@ -0,0 +1,214 @@
+import pickle
+
+import pytest
+
+from path import Path
+
+from bindgen import columnar
+from bindgen.header import (
+    ClassInfo,
+    ClassTemplateInfo,
+    ConstructorInfo,
+    EnumInfo,
+    FunctionInfo,
+    HeaderInfo,
+    MethodInfo,
+    TypedefInfo,
+)
+from bindgen.ir import IR, write_ir
+from bindgen.module import ModuleInfo
+from bindgen.utils import object_digest
+
+
+def _info(cls, **attrs):
+    """Info object without a cursor, attributes not given stay unset
+    """
+
+    rv = cls.__new__(cls)
+
+    for k, v in attrs.items():
+        setattr(rv, k, v)
+
+    return rv
+
+
+def _method(cls, name, args=(), return_type="void", **attrs):
+
+    return _info(
+        cls,
+        name=name,
+        comment=None,
+        full_name=f"Cls::{name}",
+        mangled_name=f"_ZN3Cls{len(name)}{name}Ev",
+        return_type=return_type,
+        args=[tuple(arg) for arg in args],
+        inline=False,
+        **attrs,
+    )
+
+
+def make_module(name, base=None):
+
+    enum = _info(EnumInfo, name=f"{name}_Kind", comment="", values=["A", "B"])
+    enum.anonymous = False
+
+    get = _method(MethodInfo, "Get", return_type="double", const=True)
+    set_ = _method(
+        MethodInfo,
+        "Set",
+        [("theValue", "const Standard_Real", "0.5"), ("", "int", None)],
+        const=False,
+    )
+    ctor = _method(ConstructorInfo, name, [("theOther", f"const {name}_Cls &", None)])
+
+    cls = _info(
+        ClassInfo,
+        name=f"{name}_Cls",
+        comment="A class\nwith a comment",
+        abstract=False,
+        constructors=[ctor],
+        methods=[get, set_],
+        static_methods=[],
+        methods_byref=[],
+        enums=[enum],
+        superclass=[base] if base else [],
+        superclasses=[base] if base else [],
+        rootclass=[base] if base else [],
+        nonpublic_destructors=[],
+    )
+    cls.methods_unfiltered = tuple(cls.methods)
+    cls.constructors_unfiltered = tuple(cls.constructors)
+
+    template = _info(
+        ClassTemplateInfo,
+        name=f"{name}_Array",
+        comment=None,
+        methods=[_method(MethodInfo, "Size", return_type="int", const=True)],
+        type_params=[(None, "T", None), ("int", "N", "3")],
+        superclass=[],
+    )
+
+    typedef = _info(
+        TypedefInfo,
+        name=f"{name}_Ints",
+        comment=None,
+        type=f"{name}_Array<int, 3>",
+        pod=False,
+        template_base=[f"{name}_Array"],
+        template_args=["int", "3"],
+    )
+
+    function = _method(FunctionInfo, "Make", [("n", "int", "-1")], f"{name}_Cls")
+    function.namespace = None
+
+    header = HeaderInfo()
+    header.name = Path(f"/include/{name}_Cls.hxx")
+    header.short_name = f"{name}_Cls.hxx"
+    header.dependencies = [Path("/include/Standard.hxx"), header.name]
+    header.classes = {cls.name: cls}
+    header.class_dict = {cls.name: cls}
+    header.class_templates = {template.name: template}
+    header.class_template_dict = {template.name: template}
+    header.functions = [function]
+    header.enums = [enum]
+    header.typedefs = [typedef]
+    header.typedef_dict = {typedef.name: typedef.type}
+    header.namespaces = {"std"}
+
+    return ModuleInfo(
+        name, Path("/include"), [], [name, "Standard"], None, headers=[header]
+    )
+
+
+def roundtrip(obj):
+
+    return columnar.loads(columnar.dumps(obj))
+
+
+def test_module_roundtrip():
+
+    m = make_module("Mod")
+    rv = roundtrip(m)
+
+    assert object_digest(rv) == object_digest(pickle.loads(pickle.dumps(m)))
+    assert object_digest(rv) == object_digest(m)
+
+    # shared references stay shared
+    cls = rv.classes[0]
+    assert rv.class_dict[cls.name] is cls
+    assert rv.headers[0].classes[cls.name] is cls
+    assert cls.methods_unfiltered[0] is cls.methods[0]
+    assert cls.enums[0] is rv.enums[0]
+
+    # values keep their types, unset attributes stay unset
+    assert type(rv.headers[0].name) is Path
+    assert type(cls.methods_unfiltered) is tuple
+    assert rv.namespaces == {"std"}
+    assert rv.dependencies_headers == {"Standard"}
+    assert cls.methods[1].args == [
+        ("theValue", "const Standard_Real", "0.5"),
+        ("", "int", None),
+    ]
+    assert not hasattr(cls, "operators")
+
+
+@pytest.mark.parametrize(
+    "value",
+    [
+        [None, True, False, 0, -1, 2 ** 63 - 1, -(2 ** 63), "", "é", ()],
+        [0.5, -0.0, float("inf"), 1e-300],
+        {"a": (1, "b"), 2: [3], (4, 5): {6}},
+    ],
+)
+def test_values(value):
+
+    assert roundtrip(value) == value
+
+
+def test_shared_and_recursive_containers():
+
+    a = [1]
+    d = {"a": a}
+    d["self"] = d
+    lst = [a, a, d, (a, "t")]
+    lst.append(lst)
+
+    rv = roundtrip(lst)
+
+    assert rv[0] is rv[1] is rv[2]["a"] is rv[3][0]
+    assert rv[2]["self"] is rv[2]
+    assert rv[4] is rv
+
+    with pytest.raises(ValueError):
+        t = ([],)
+        t[0].append(t)
+        columnar.dumps(t)
+
+
+def test_limitations():
+
+    with pytest.raises(ValueError):
+        columnar.dumps(["a\0b"])
+
+    with pytest.raises(OverflowError):
+        columnar.dumps(2 ** 63)
+
+
+@pytest.mark.parametrize("format", ["pickle", "columnar"])
+def test_ir_lookup(tmp_path, format):
+
+    modules = [make_module("Base"), make_module("Mod", base="Base_Cls")]
+    path = Path(tmp_path) / "ir"
+
+    write_ir(path, "transformed", modules, format)
+    ir = IR(path, stage="transformed")
+
+    for m in modules:
+        assert object_digest(ir.module(m.name)) == object_digest(m)
+
+        classes = ir.lookup(m.name, "classes")
+        assert m.classes[0].name in classes
+        assert object_digest(classes[m.classes[0].name]) == object_digest(m.classes[0])
+
+    assert object_digest(ir.classes["Base_Cls"]) == object_digest(modules[0].classes[0])
+    assert ir.classes["Mod_Cls"].superclass == ["Base_Cls"]
@@ -0,0 +1,64 @@
+import pytest
+
+from path import Path
+
+from bindgen.exports import find_libraries, is_library, read_exports
+
+# generated by data/exports/make.py, expected names as listed by nm -D,
+# llvm-nm --arch=all and llvm-readobj --coff-exports
+DATA = Path(__file__).dirname() / "data" / "exports"
+
+PE_EXPORTS = ["?member@Cls@@QEAAXXZ", "shared_data", "shared_func"]
+
+
+@pytest.mark.parametrize(
+    "name, expected",
+    [
+        ("fixture.so", ["shared_data", "shared_func", "weak_func"]),
+        ("pe32.dll", PE_EXPORTS),
+        ("pe32plus.dll", PE_EXPORTS),
+        ("noexports.dll", []),
+        ("x86_64.dylib", ["_shared_data", "_shared_func", "_x86_only"]),
+        ("i386.dylib", ["_shared_data", "_shared_func", "_x86_only"]),
+        ("arm64.dylib", ["_arm_only", "_shared_data", "_shared_func"]),
+        (
+            "universal.dylib",
+            ["_arm_only", "_shared_data", "_shared_func", "_x86_only"],
+        ),
+    ],
+)
+def test_read_exports(name, expected):
+
+    assert is_library(DATA / name)
+    assert sorted(read_exports(DATA / name)) == expected
+
+
+def test_not_a_library(tmp_path):
+
+    tmp_path = Path(tmp_path)
+
+    # MZ without the PE signature at e_lfanew
+    (tmp_path / "stray.txt").write_bytes(b"MZ" + b"\0" * 0x3A + b"\x40\0\0\0ZZZZ")
+    (tmp_path / "short.bin").write_bytes(b"MZ")
+    (tmp_path / "empty").write_bytes(b"")
+    (DATA / "pe32.dll").copy(tmp_path / "lib.dll")
+
+    assert not is_library(tmp_path / "stray.txt")
+    assert find_libraries(tmp_path) == [tmp_path / "lib.dll"]
+
+    with pytest.raises(ValueError):
+        read_exports(tmp_path / "stray.txt")
+
+
+def test_find_libraries():
+
+    assert [p.name for p in find_libraries(DATA)] == [
+        "arm64.dylib",
+        "fixture.so",
+        "i386.dylib",
+        "noexports.dll",
+        "pe32.dll",
+        "pe32plus.dll",
+        "universal.dylib",
+        "x86_64.dylib",
+    ]